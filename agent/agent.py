@@ -1,11 +1,16 @@
 import argparse
+import http.client
+import json
 import platform
 import socket
+import ssl
 import time
+import urllib.parse
 import requests
 import psutil
 import uuid
 import logging
+import math
 import subprocess
 import os
 from typing import Dict, Any, List
@@ -244,11 +249,14 @@ def get_ram_info():
         info["total_MB"] = vm.total // 1024 // 1024
         if platform.system() == "Linux":
             try:
-                with open('/proc/meminfo') as f:
-                    lines = f.readlines()
-                for l in lines:
-                    if "MemTotal" in l:
-                        info["meminfo_total"] = l.strip()
+                if _proc:
+                    info["meminfo_total"] = _proc.meminfo_line()
+                else:
+                    with open('/proc/meminfo') as f:
+                        for l in f:
+                            if "MemTotal" in l:
+                                info["meminfo_total"] = l.strip()
+                                break
             except Exception:
                 pass
         elif platform.system() == "Windows":
@@ -332,6 +340,369 @@ def get_zombie_process_count():
         pass
     return cnt
 
+# ---------- Docker Containers (Engine API over the unix socket) ----------
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=2):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.unix_path)
+        self.sock = sock
+
+def _docker_tls_context():
+    """Client TLS context from DOCKER_TLS_VERIFY/DOCKER_CERT_PATH, as the docker CLI uses them."""
+    if not os.environ.get("DOCKER_TLS_VERIFY"):
+        return None
+    cert_path = os.environ.get("DOCKER_CERT_PATH") or os.path.expanduser("~/.docker")
+    ctx = ssl.create_default_context(cafile=os.path.join(cert_path, "ca.pem"))
+    ctx.load_cert_chain(os.path.join(cert_path, "cert.pem"), os.path.join(cert_path, "key.pem"))
+    return ctx
+
+def docker_host():
+    """("unix", socket path) or ("tcp", (host, port)) from DOCKER_HOST, default the local socket."""
+    host = os.environ.get("DOCKER_HOST", "")
+    if host.startswith("tcp://"):
+        url = urllib.parse.urlsplit(host)
+        default_port = 2376 if os.environ.get("DOCKER_TLS_VERIFY") else 2375
+        return "tcp", (url.hostname or "localhost", url.port or default_port)
+    if host.startswith("unix://"):
+        return "unix", host[len("unix://"):]
+    return "unix", "/var/run/docker.sock"
+
+class DockerClient:
+    """
+    Minimal Docker Engine API client over the daemon's unix socket or a
+    tcp:// DOCKER_HOST. Keeps one keep-alive connection and reconnects once
+    if the daemon closed it.
+    """
+
+    def __init__(self, path=None, timeout=2):
+        self.scheme, self.address = ("unix", path) if path else docker_host()
+        self.timeout = timeout
+        self._conn = None
+        self._prev_cpu = {}
+
+    def available(self):
+        if self.scheme == "tcp":
+            return True
+        return hasattr(socket, "AF_UNIX") and os.path.exists(self.address)
+
+    def _connect(self):
+        if self.scheme == "unix":
+            return _UnixHTTPConnection(self.address, self.timeout)
+        host, port = self.address
+        context = _docker_tls_context()
+        if context is not None:
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=context)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def get(self, path):
+        for attempt in (0, 1):
+            if self._conn is None:
+                self._conn = self._connect()
+            try:
+                self._conn.request("GET", path)
+                res = self._conn.getresponse()
+                body = res.read()
+            except (http.client.HTTPException, OSError):
+                self.close()
+                if attempt:
+                    raise
+                continue
+            if res.status >= 400:
+                raise RuntimeError(f"Docker API {path} returned HTTP {res.status}")
+            return json.loads(body) if body else None
+
+    def container_stats(self):
+        """One-shot stats for every running container; CPU % is computed against the previous call."""
+        containers = []
+        seen = set()
+        for c in self.get("/containers/json") or []:
+            cid = c.get("Id", "")
+            try:
+                s = self.get(f"/containers/{cid}/stats?stream=false&one-shot=true") or {}
+            except Exception:
+                continue
+            seen.add(cid)
+            cpu_stats = s.get("cpu_stats") or {}
+            total = (cpu_stats.get("cpu_usage") or {}).get("total_usage", 0)
+            system = cpu_stats.get("system_cpu_usage", 0)
+            online = cpu_stats.get("online_cpus") or len((cpu_stats.get("cpu_usage") or {}).get("percpu_usage") or []) or 1
+            cpu_percent = 0.0
+            prev = self._prev_cpu.get(cid)
+            if prev and system > prev[1] and total >= prev[0]:
+                cpu_percent = round((total - prev[0]) / (system - prev[1]) * online * 100, 2)
+            self._prev_cpu[cid] = (total, system)
+
+            mem = s.get("memory_stats") or {}
+            mem_stats = mem.get("stats") or {}
+            # Same as `docker stats`: exclude inactive page cache (cgroup v1 "total_inactive_file", v2 "inactive_file")
+            inactive = mem_stats.get("total_inactive_file", mem_stats.get("inactive_file", 0))
+            mem_usage = mem.get("usage", 0)
+            if inactive < mem_usage:
+                mem_usage -= inactive
+            mem_limit = mem.get("limit", 0)
+
+            blk_read = blk_write = 0
+            for entry in (s.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []:
+                op = str(entry.get("op", "")).lower()
+                if op == "read":
+                    blk_read += entry.get("value", 0)
+                elif op == "write":
+                    blk_write += entry.get("value", 0)
+            networks = s.get("networks") or {}
+
+            containers.append({
+                "id": cid[:12],
+                "name": (c.get("Names") or [""])[0].lstrip("/"),
+                "image": c.get("Image"),
+                "state": c.get("State"),
+                "status": c.get("Status"),
+                "cpu_percent": cpu_percent,
+                "memory_usage": max(0, mem_usage),
+                "memory_limit": mem_limit,
+                "memory_percent": round(max(0, mem_usage) / mem_limit * 100, 2) if mem_limit else 0,
+                "net_rx_bytes": sum(n.get("rx_bytes", 0) for n in networks.values()),
+                "net_tx_bytes": sum(n.get("tx_bytes", 0) for n in networks.values()),
+                "blkio_read_bytes": blk_read,
+                "blkio_write_bytes": blk_write,
+                "pids": (s.get("pids_stats") or {}).get("current"),
+            })
+        for cid in list(self._prev_cpu):
+            if cid not in seen:
+                del self._prev_cpu[cid]
+        return containers
+
+_docker = DockerClient()
+
+def get_container_stats():
+    if not _docker.available():
+        return []
+    try:
+        return _docker.container_stats()
+    except Exception:
+        return []
+
+def get_docker_status():
+    """Daemon reachability and running container count; CLI fallback where there is no daemon socket."""
+    if _docker.available():
+        try:
+            info = _docker.get("/info") or {}
+            return {"running": True, "running_containers": info.get("ContainersRunning", 0)}
+        except Exception:
+            return {"running": False, "running_containers": 0}
+    running = False
+    running_containers = 0
+    try:
+        res = subprocess.run(["docker", "info"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=1)
+        running = (res.returncode == 0)
+        if running:
+            ps = subprocess.run(["docker", "ps", "-q"], capture_output=True, text=True, timeout=1)
+            running_containers = len([l for l in ps.stdout.splitlines() if l.strip()])
+    except Exception:
+        pass
+    return {"running": running, "running_containers": running_containers}
+
+# ---------- Linux /proc Fast Path ----------
+class ProcFile:
+    """Keeps a /proc file open and re-reads it with pread into a reusable buffer."""
+
+    def __init__(self, path, size=16384):
+        self.fd = os.open(path, os.O_RDONLY)
+        self.buf = bytearray(size)
+
+    def read(self):
+        while True:
+            n = os.preadv(self.fd, [self.buf], 0)
+            if n < len(self.buf):
+                return n
+            # File larger than the buffer: grow once and retry
+            self.buf = bytearray(len(self.buf) * 2)
+
+    def close(self):
+        os.close(self.fd)
+
+def _meminfo_kb(buf, n, key):
+    i = buf.find(key, 0, n)
+    if i < 0:
+        return None
+    return int(buf[i + len(key):buf.find(b"\n", i, n)].split()[0])
+
+class ProcStats:
+    """
+    Direct reader for the hot Linux counters (/proc/stat, /proc/meminfo,
+    /proc/diskstats, /proc/net/dev). Values match the psutil calls used by
+    collect_metrics; only the fields we report are parsed.
+    """
+
+    def __init__(self):
+        self.stat = ProcFile("/proc/stat")
+        self.meminfo = ProcFile("/proc/meminfo")
+        self.diskstats = ProcFile("/proc/diskstats", 65536)
+        self.netdev = ProcFile("/proc/net/dev")
+
+    def cpu_times(self):
+        """Return [(busy, total)] for the aggregate line followed by each core."""
+        buf = self.stat.buf
+        n = self.stat.read()
+        end = buf.find(b"\nintr", 0, n)
+        times = []
+        for line in buf[:end if end > 0 else n].split(b"\n"):
+            if not line.startswith(b"cpu"):
+                break
+            # user nice system idle iowait irq softirq steal (guest time is already in user/nice)
+            fields = [int(x) for x in line.split()[1:9]]
+            total = sum(fields)
+            times.append((total - fields[3] - fields[4], total))
+        return times
+
+    def memory(self):
+        buf = self.meminfo.buf
+        n = self.meminfo.read()
+        total = _meminfo_kb(buf, n, b"MemTotal:") * 1024
+        free = (_meminfo_kb(buf, n, b"MemFree:") or 0) * 1024
+        avail = _meminfo_kb(buf, n, b"MemAvailable:")
+        avail = avail * 1024 if avail is not None else free
+        swap_total = (_meminfo_kb(buf, n, b"SwapTotal:") or 0) * 1024
+        swap_free = (_meminfo_kb(buf, n, b"SwapFree:") or 0) * 1024
+        swap_used = swap_total - swap_free
+        mem = {
+            "total": total,
+            "available": avail,
+            "percent": round((total - avail) * 100.0 / total, 1) if total else 0.0,
+            "used": total - avail,
+            "free": free,
+        }
+        swap = {
+            "total": swap_total,
+            "used": swap_used,
+            "free": swap_free,
+            "percent": round(swap_used * 100.0 / swap_total, 1) if swap_total else 0.0,
+        }
+        return mem, swap
+
+    def meminfo_line(self, key=b"MemTotal:"):
+        buf = self.meminfo.buf
+        n = self.meminfo.read()
+        i = buf.find(key, 0, n)
+        return buf[i:buf.find(b"\n", i, n)].decode().strip() if i >= 0 else None
+
+    def disk_io(self):
+        buf = self.diskstats.buf
+        n = self.diskstats.read()
+        result = {}
+        for line in buf[:n].split(b"\n"):
+            f = line.split()
+            if len(f) < 10:
+                continue
+            # major minor name reads merged sectors_read ms writes merged sectors_written
+            result[f[2].decode()] = {
+                "read_count": int(f[3]),
+                "read_bytes": int(f[5]) * 512,
+                "write_count": int(f[7]),
+                "write_bytes": int(f[9]) * 512,
+            }
+        return result
+
+    def net_io(self):
+        buf = self.netdev.buf
+        n = self.netdev.read()
+        result = {}
+        for line in buf[:n].split(b"\n")[2:]:
+            name, sep, rest = line.partition(b":")
+            if not sep:
+                continue
+            f = rest.split()
+            result[name.strip().decode()] = {
+                "bytes_recv": int(f[0]),
+                "packets_recv": int(f[1]),
+                "errin": int(f[2]),
+                "dropin": int(f[3]),
+                "bytes_sent": int(f[8]),
+                "packets_sent": int(f[9]),
+                "errout": int(f[10]),
+                "dropout": int(f[11]),
+            }
+        return result
+
+def _open_proc_stats():
+    if platform.system() != "Linux" or not hasattr(os, "preadv"):
+        return None
+    try:
+        return ProcStats()
+    except Exception as e:
+        logger.warning("Falling back to psutil for hot metrics: %s", e)
+        return None
+
+_proc = _open_proc_stats()
+
+# Hot-path readers: /proc fast path on Linux, psutil elsewhere
+def _busy_total(times):
+    # Same accounting as psutil.cpu_percent(): guest time is already in user/nice
+    t = times._asdict()
+    total = sum(t.values()) - t.get("guest", 0) - t.get("guest_nice", 0)
+    return total - t.get("idle", 0) - t.get("iowait", 0), total
+
+def read_cpu_times():
+    """[(busy, total)] for the aggregate followed by each core."""
+    if _proc:
+        return _proc.cpu_times()
+    return [_busy_total(t) for t in [psutil.cpu_times()] + psutil.cpu_times(percpu=True)]
+
+class CpuMeter:
+    """
+    CPU utilisation since this meter's previous reading. Each meter keeps its
+    own baseline, so the sampling window does not shorten the interval that
+    collect_metrics reports over (psutil.cpu_percent() shares one).
+    """
+
+    def __init__(self):
+        self._last = read_cpu_times()
+
+    def percent(self):
+        """(total_percent, per_core_percent) since the previous call."""
+        now = read_cpu_times()
+        percents = []
+        for (busy, total), (prev_busy, prev_total) in zip(now, self._last):
+            dt = total - prev_total
+            percents.append(round(min(100.0, max(0.0, (busy - prev_busy) * 100.0 / dt)), 1) if dt > 0 else 0.0)
+        self._last = now
+        if not percents:
+            return 0.0, []
+        return percents[0], percents[1:]
+
+_cpu_meter = CpuMeter()
+
+def read_cpu_percent():
+    """CPU utilisation since the previous report (collect_metrics' own baseline)."""
+    return _cpu_meter.percent()
+
+def read_memory():
+    if _proc:
+        return _proc.memory()
+    return psutil.virtual_memory()._asdict(), psutil.swap_memory()._asdict()
+
+def read_disk_io():
+    if _proc:
+        return _proc.disk_io()
+    try:
+        return {k: v._asdict() for k, v in (psutil.disk_io_counters(perdisk=True) or {}).items()}
+    except Exception:
+        return {}
+
+def read_net_io():
+    if _proc:
+        return _proc.net_io()
+    return {k: v._asdict() for k, v in psutil.net_io_counters(pernic=True).items()}
+
 # ---------- Metrics Collection with Preemptive Alerts ----------
 _last_metrics = {}
 
@@ -344,17 +715,17 @@ def collect_metrics(custom_alert_flag=False) -> Dict[str, Any]:
     except (AttributeError, NotImplementedError):
         load_avg = (0, 0, 0)
 
-    cpu_perc = psutil.cpu_percent(percpu=True)
-    cpu_total = psutil.cpu_percent()
-    mem = psutil.virtual_memory()
-    swap = psutil.swap_memory()
+    cpu_total, cpu_perc = read_cpu_percent()
+    mem, swap = read_memory()
 
     disks = []
     inode_alerts = []
+    disk_io = read_disk_io()
     for part in psutil.disk_partitions(all=False):
         try:
             usage = psutil.disk_usage(part.mountpoint)
-            io = psutil.disk_io_counters(perdisk=True).get(part.device, {})
+            # Per-disk counters are keyed by kernel name ("sda1"), partitions by path ("/dev/sda1")
+            io = disk_io.get(os.path.basename(part.device), {})
             inode = get_inode_usage(part.mountpoint)
             disks.append({
                 "device": part.device,
@@ -381,19 +752,19 @@ def collect_metrics(custom_alert_flag=False) -> Dict[str, Any]:
         except Exception:
             continue
 
-    net_io = psutil.net_io_counters(pernic=True)
+    net_io = read_net_io()
     net_stats = []
     for nic, stats in net_io.items():
         net_stats.append({
             "interface": nic,
-            "bytes_sent": stats.bytes_sent,
-            "bytes_recv": stats.bytes_recv,
-            "packets_sent": stats.packets_sent,
-            "packets_recv": stats.packets_recv,
-            "errin": stats.errin,
-            "errout": stats.errout,
-            "dropin": stats.dropin,
-            "dropout": stats.dropout,
+            "bytes_sent": stats["bytes_sent"],
+            "bytes_recv": stats["bytes_recv"],
+            "packets_sent": stats["packets_sent"],
+            "packets_recv": stats["packets_recv"],
+            "errin": stats["errin"],
+            "errout": stats["errout"],
+            "dropin": stats["dropin"],
+            "dropout": stats["dropout"],
         })
 
     processes = []
@@ -437,14 +808,14 @@ def collect_metrics(custom_alert_flag=False) -> Dict[str, Any]:
             "load_avg": load_avg
         },
         "memory": {
-            "total": mem.total,
-            "available": mem.available,
-            "percent": mem.percent,
-            "used": mem.used,
-            "free": mem.free,
-            "swap_total": swap.total,
-            "swap_used": swap.used,
-            "swap_percent": swap.percent
+            "total": mem["total"],
+            "available": mem["available"],
+            "percent": mem["percent"],
+            "used": mem["used"],
+            "free": mem["free"],
+            "swap_total": swap["total"],
+            "swap_used": swap["used"],
+            "swap_percent": swap["percent"]
         },
         "disks": disks,
         "network": net_stats,
@@ -457,7 +828,8 @@ def collect_metrics(custom_alert_flag=False) -> Dict[str, Any]:
         "sensors_temperature": sensors_temp,
         "time_drift": time_drift,
         "zombie_processes": zombie_procs,
-        "critical_processes": critical_procs
+        "critical_processes": critical_procs,
+        "containers": get_container_stats()
     }
 
     # ---------- Preemptive Abnormal Alerts ----------
@@ -465,7 +837,7 @@ def collect_metrics(custom_alert_flag=False) -> Dict[str, Any]:
 
     if cpu_total > 85:
         preemptive_alerts.append("High CPU usage (>85%)")
-    if mem.percent > 85:
+    if mem["percent"] > 85:
         preemptive_alerts.append("High memory usage (>85%)")
     for disk in disks:
         if disk["percent"] > 90:
@@ -477,31 +849,118 @@ def collect_metrics(custom_alert_flag=False) -> Dict[str, Any]:
     if _last_metrics:
         if abs(cpu_total - _last_metrics["cpu"]) > 30:
             preemptive_alerts.append("CPU usage spike (>30%)")
-        if abs(mem.percent - _last_metrics["mem"]) > 30:
+        if abs(mem["percent"] - _last_metrics["mem"]) > 30:
             preemptive_alerts.append("Memory usage spike (>30%)")
-    _last_metrics = {"cpu": cpu_total, "mem": mem.percent}
+    _last_metrics = {"cpu": cpu_total, "mem": mem["percent"]}
 
     data["preemptive_alerts"] = preemptive_alerts
     data["custom_alert"] = custom_alert_flag or bool(preemptive_alerts) or os.path.exists("TRIGGER_CUSTOM_ALERT")
 
     return data
 
+# ---------- High-frequency Sampling Windows ----------
+def summarize(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+    p95 = ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+    return {
+        "min": ordered[0],
+        "max": ordered[-1],
+        "mean": round(sum(values) / len(values), 2),
+        "p95": p95,
+        "last": values[-1],
+    }
+
+class SampleWindow:
+    """
+    Samples CPU, memory and network throughput every `sample_interval` seconds
+    between uploads and reduces them to min/max/mean/p95/last per window, so
+    short spikes show up without posting more often.
+    """
+
+    def __init__(self, sample_interval=0.25):
+        self.sample_interval = sample_interval
+        self._cpu = CpuMeter()
+        self._last_net = None
+        self.reset()
+
+    def reset(self):
+        self.start = time.time()
+        self.cpu = []
+        self.mem = []
+        self.net_recv = []
+        self.net_sent = []
+
+    def sample(self):
+        now = time.time()
+        self.cpu.append(self._cpu.percent()[0])
+        self.mem.append(read_memory()[0]["percent"])
+        try:
+            nics = read_net_io().values()
+            net = (sum(n["bytes_recv"] for n in nics), sum(n["bytes_sent"] for n in nics))
+            if self._last_net is not None:
+                prev_t, prev = self._last_net
+                dt = now - prev_t
+                if dt > 0:
+                    self.net_recv.append(round(max(0, net[0] - prev[0]) / dt, 1))
+                    self.net_sent.append(round(max(0, net[1] - prev[1]) / dt, 1))
+            self._last_net = (now, net)
+        except Exception:
+            pass
+
+    def sample_until(self, deadline):
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return
+            time.sleep(min(self.sample_interval, remaining))
+            self.sample()
+
+    def summary(self):
+        """Return the current window's summary and start a new window."""
+        data = {
+            "start": self.start,
+            "end": time.time(),
+            "samples": len(self.cpu),
+            "sample_interval_sec": self.sample_interval,
+            "cpu_percent": summarize(self.cpu),
+            "mem_percent": summarize(self.mem),
+            "net_recv_Bps": summarize(self.net_recv),
+            "net_sent_Bps": summarize(self.net_sent),
+        }
+        self.reset()
+        return data
+
 # ---------- Main ----------
-def main(server_url, interval=5):
+def main(server_url, interval=5, sample_interval=0.25):
     logger.info("Agent started. Posting to %s every %ss", server_url, interval)
+    window = SampleWindow(sample_interval) if sample_interval and sample_interval < interval else None
     while True:
+        started = time.time()
         metrics = collect_metrics()
+        # Lets the backend judge missed reports before it has seen two of them
+        metrics["interval_sec"] = interval
+        if window and window.cpu:
+            metrics["window"] = window.summary()
         try:
             res = requests.post(f"{server_url}/metrics", json=metrics, timeout=5)
-            logger.info("Metrics sent: status %s", res.status_code)
+            if res.status_code >= 400:
+                logger.error("Metrics rejected: status %s: %s", res.status_code, res.text[:200])
+            else:
+                logger.info("Metrics sent: status %s", res.status_code)
         except Exception as e:
             logger.error("Failed to send metrics: %s", e)
-        time.sleep(interval)
+        if window:
+            window.sample_until(started + interval)
+        else:
+            time.sleep(interval)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--server", type=str, required=True, help="Backend server URL")
     parser.add_argument("--interval", type=int, default=5, help="Seconds between metric reports")
+    parser.add_argument("--sample-interval", type=float, default=0.25, help="Seconds between internal CPU/memory/network samples summarised per report (0 to disable)")
     parser.add_argument("--custom-alert", action="store_true", help="Trigger a custom alert in next report for testing")
     args = parser.parse_args()
-    main(args.server, args.interval)
+    main(args.server, args.interval, args.sample_interval)
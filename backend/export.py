@@ -0,0 +1,153 @@
+import csv
+import io
+import json
+from typing import Iterable, Iterator, List, Optional
+
+DEFAULT_FIELDS = ["cpu.total_percent", "memory.percent"]
+CHUNK_ROWS = 1000
+
+CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def parse_list(value: Optional[str]) -> List[str]:
+    return [v.strip() for v in (value or "").split(",") if v.strip()]
+
+def get_path(entry: dict, path: str):
+    """Resolve a dotted field path ("cpu.total_percent", "disks.0.percent") in a snapshot."""
+    value = entry
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part)
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return None
+    return value
+
+def iter_rows(store, agents: Iterable[str], fields: List[str],
+              start: Optional[float] = None, end: Optional[float] = None) -> Iterator[dict]:
+    """
+    Yield one flat row per stored snapshot, agent by agent. Only one agent's
+    snapshots are fetched at a time and the store lock is not held while
+    rows are being consumed.
+    """
+    for agent_id in agents:
+        with store.read_lock():
+            entries = store.entries(agent_id)
+        for e in entries:
+            ts = e.get("timestamp", 0)
+            if (start is not None and ts < start) or (end is not None and ts > end):
+                continue
+            row = {"agent_id": agent_id, "timestamp": ts}
+            for f in fields:
+                row[f] = get_path(e, f)
+            yield row
+
+def _chunks(rows: Iterator[dict], size: int = CHUNK_ROWS) -> Iterator[List[dict]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# ---------- Encoders (each yields bytes lazily) ----------
+def to_ndjson(rows: Iterator[dict]) -> Iterator[bytes]:
+    for chunk in _chunks(rows):
+        yield "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in chunk).encode()
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"))
+    return "" if value is None else value
+
+def to_csv(rows: Iterator[dict], fields: List[str]) -> Iterator[bytes]:
+    columns = ["agent_id", "timestamp"] + fields
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    for chunk in _chunks(rows):
+        for r in chunk:
+            writer.writerow([_csv_value(r.get(c)) for c in columns])
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+class _Drain:
+    """Minimal writable file object so pyarrow writers can be drained between batches."""
+
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+def _is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+def to_arrow(rows: Iterator[dict], fields: List[str], fmt: str = "arrow") -> Iterator[bytes]:
+    """
+    Arrow IPC stream or Parquet, one record batch / row group per chunk.
+    Column types come from the first chunk: numeric fields become float64,
+    anything else a (JSON-encoded) string.
+    """
+    import pyarrow as pa
+
+    def open_writer(chunk):
+        cols = [pa.field("agent_id", pa.string()), pa.field("timestamp", pa.float64())]
+        for f in fields:
+            values = [r.get(f) for r in chunk if r.get(f) is not None]
+            numeric = bool(values) and all(_is_number(v) for v in values)
+            cols.append(pa.field(f, pa.float64() if numeric else pa.string()))
+        schema = pa.schema(cols)
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            return schema, pq.ParquetWriter(sink, schema)
+        return schema, pa.ipc.new_stream(sink, schema)
+
+    sink = _Drain()
+    writer = None
+    schema = None
+    for chunk in _chunks(rows):
+        if schema is None:
+            schema, writer = open_writer(chunk)
+        arrays = []
+        for col in schema:
+            values = [r.get(col.name) for r in chunk]
+            if col.type == pa.float64():
+                values = [float(v) if _is_number(v) else None for v in values]
+            else:
+                values = [None if v is None else (v if isinstance(v, str) else json.dumps(v)) for v in values]
+            arrays.append(pa.array(values, type=col.type))
+        batch = pa.record_batch(arrays, schema=schema)
+        if fmt == "parquet":
+            writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            writer.write_batch(batch)
+        yield sink.take()
+    if writer is None:
+        # No rows: still emit a valid (empty) stream/file
+        schema, writer = open_writer([])
+    writer.close()
+    yield sink.take()
@@ -0,0 +1,175 @@
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+UP, STALE, DOWN, EVICTED = "up", "stale", "down", "evicted"
+
+class LivenessTracker:
+    """
+    Tracks when each agent is next expected to report, using a min-heap of
+    deadlines with exactly one live entry per agent. A report only updates
+    `last_seen`; the heap entry is re-pushed lazily when it comes due, so the
+    cost per tick is proportional to the agents that actually need checking,
+    never to the fleet size.
+
+    An agent is `stale` after `stale_intervals` missed reports, `down` after
+    `down_intervals`, and evicted `evict_after` seconds after its last report.
+    The expected interval is the one the agent reports (`interval_sec`);
+    for agents that do not send it, it is learned from the gaps between reports.
+    """
+
+    def __init__(self, stale_intervals: float = 3, down_intervals: float = 10,
+                 evict_after: float = 3600, default_interval: float = 5):
+        self.stale_intervals = stale_intervals
+        self.down_intervals = down_intervals
+        self.evict_after = evict_after
+        self.default_interval = default_interval
+        self.agents: Dict[str, dict] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._tokens = itertools.count()
+        self._counts = {UP: 0, STALE: 0, DOWN: 0}
+
+    def _set_state(self, info: dict, state: str):
+        self._counts[info["state"]] -= 1
+        info["state"] = state
+        if state in self._counts:
+            self._counts[state] += 1
+
+    def _deadline(self, info: dict) -> float:
+        interval = info["interval"]
+        if info["state"] == UP:
+            return info["last_seen"] + self.stale_intervals * interval
+        if info["state"] == STALE:
+            return info["last_seen"] + self.down_intervals * interval
+        return info["last_seen"] + max(self.evict_after, self.down_intervals * interval)
+
+    def _classify(self, info: dict, now: float) -> str:
+        age = now - info["last_seen"]
+        if age >= max(self.evict_after, self.down_intervals * info["interval"]):
+            return EVICTED
+        if age >= self.down_intervals * info["interval"]:
+            return DOWN
+        if age >= self.stale_intervals * info["interval"]:
+            return STALE
+        return UP
+
+    def _add(self, device: str, last_seen: float, interval: Optional[float], state: str = UP):
+        info = {"last_seen": last_seen, "interval": max(1.0, float(interval or self.default_interval)),
+                "learned": bool(interval), "state": state}
+        self.agents[device] = info
+        self._counts[state] += 1
+        self._schedule(device, info)
+
+    def _schedule(self, device: str, info: dict):
+        info["token"] = next(self._tokens)
+        heapq.heappush(self._heap, (self._deadline(info), info["token"], device))
+
+    def seen(self, device: str, now: Optional[float] = None, previous_seen: Optional[float] = None,
+             interval: Optional[float] = None) -> str:
+        """
+        Record a report; returns the state the agent was in before it.
+        `previous_seen` is the shared store's previous report time, if any, so
+        the interval estimate is right when reports are spread over workers.
+        `interval` is the report interval the agent announced, if any.
+        """
+        now = time.time() if now is None else now
+        info = self.agents.get(device)
+        if info is None:
+            if not interval and previous_seen and 0 < now - previous_seen < self.evict_after:
+                # Reported before (another worker, or before a restart with the shared store)
+                interval = now - previous_seen
+            self._add(device, now, interval)
+            return UP
+        gap = now - max(info["last_seen"], previous_seen or 0)
+        previous = info["state"]
+        if interval:
+            info["interval"] = max(1.0, float(interval))
+            info["learned"] = True
+        elif 0 < gap < self.evict_after:
+            if not info["learned"]:
+                # The first gap replaces the default, so slow agents stop flapping after one cycle
+                info["interval"] = max(1.0, gap)
+                info["learned"] = True
+            elif previous == UP:
+                # Smoothed estimate; a gap that ends an outage says nothing about the interval
+                info["interval"] = max(1.0, 0.8 * info["interval"] + 0.2 * gap)
+        info["last_seen"] = now
+        if previous != UP:
+            self._set_state(info, UP)
+            self._schedule(device, info)
+        return previous
+
+    def restore(self, device: str, last_seen: float, interval: Optional[float] = None,
+                now: Optional[float] = None):
+        """Track an agent moved from another shard from its last report there, not from now."""
+        now = time.time() if now is None else now
+        self.forget(device)
+        info = {"last_seen": last_seen, "interval": max(1.0, float(interval or self.default_interval))}
+        state = self._classify(info, now)
+        # Eviction is left to the next expire() so it goes through the normal path
+        self._add(device, last_seen, interval, DOWN if state == EVICTED else state)
+
+    def refresh(self, device: str, last_seen: float, now: Optional[float] = None):
+        """Take a newer report time seen by another worker, without learning an interval from it."""
+        info = self.agents.get(device)
+        if info is None or last_seen <= info["last_seen"]:
+            return
+        now = time.time() if now is None else now
+        info["last_seen"] = last_seen
+        state = self._classify(info, now)
+        if state != info["state"] and state != EVICTED:
+            self._set_state(info, state)
+            self._schedule(device, info)
+
+    def forget(self, device: str):
+        info = self.agents.pop(device, None)
+        if info is not None:
+            self._counts[info["state"]] -= 1
+
+    def expire(self, now: Optional[float] = None,
+               last_seen: Optional[Callable[[str], Optional[float]]] = None) -> List[Tuple[str, str, str]]:
+        """
+        Pop every deadline that has passed and return (device, old_state, new_state)
+        transitions. `last_seen` may supply a fresher report time from a shared
+        store (other workers) before an agent is flagged.
+        """
+        now = time.time() if now is None else now
+        changes = []
+        while self._heap and self._heap[0][0] <= now:
+            _, token, device = heapq.heappop(self._heap)
+            info = self.agents.get(device)
+            if info is None or info["token"] != token:
+                continue
+            if last_seen is not None:
+                shared = last_seen(device)
+                if shared and shared > info["last_seen"]:
+                    info["last_seen"] = shared
+                    if info["state"] != UP:
+                        self._set_state(info, UP)
+            state = self._classify(info, now)
+            if state != info["state"]:
+                changes.append((device, info["state"], state))
+                self._set_state(info, state)
+            if state == EVICTED:
+                del self.agents[device]
+            else:
+                self._schedule(device, info)
+        return changes
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self._counts)
+
+class Archive(OrderedDict):
+    """Bounded record of evicted agents' last snapshot, oldest dropped first."""
+
+    def __init__(self, limit: int = 1000):
+        super().__init__()
+        self.limit = limit
+
+    def add(self, device: str, record: dict):
+        self.pop(device, None)
+        self[device] = record
+        while len(self) > self.limit:
+            self.popitem(last=False)
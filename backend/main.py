@@ -1,18 +1,34 @@
-from typing import Any
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../agent')))
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
 import agent
+from store import open_store, AlertStateTooLarge, SnapshotTooLarge, StoreFull
+from liveness import LivenessTracker, Archive, STALE, DOWN, EVICTED
+from process_history import ProcessHistory
+import export
 from typing import Dict, List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import logging
 import time
-import threading
 import platform
-import subprocess
 import socket
 
-app = FastAPI()
+logger = logging.getLogger("SyncPulse")
+
+@asynccontextmanager
+async def lifespan(app):
+    # Track agents already in a surviving shared-memory segment from their last report
+    check_liveness()
+    task = asyncio.create_task(liveness_loop())
+    yield
+    task.cancel()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,10 +37,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-metrics_db: Dict[str, List[dict]] = {}
-alerts: List[dict] = []
-last_alert_state: Dict[str, set] = {}
-lock = threading.Lock()
+# Snapshots, alerts and per-device alert state (in-process or shared memory, see store.py)
+store = open_store()
+
+# Agent liveness: stale/down detection and eviction of long-dead agents (see liveness.py)
+liveness = LivenessTracker(
+    stale_intervals=float(os.environ.get("SYNCPULSE_STALE_INTERVALS", "3")),
+    down_intervals=float(os.environ.get("SYNCPULSE_DOWN_INTERVALS", "10")),
+    evict_after=float(os.environ.get("SYNCPULSE_EVICT_AFTER", "3600")),
+)
+archived_agents = Archive()
+
+# Compact per-agent history of reported top processes (see process_history.py)
+process_history = ProcessHistory(retention=float(os.environ.get("SYNCPULSE_PROCESS_HISTORY_SEC", "3600")))
+# Per device: snapshots already fed into process_history (see sync_process_history)
+process_cursors: Dict[str, int] = {}
+STALE_ALERT = "Agent report overdue"
+DOWN_ALERT = "Agent stopped reporting"
 
 def check_abnormal(metrics, prev_alerts: Optional[set] = None):
     alerts_local = []
@@ -87,18 +116,40 @@ def check_abnormal(metrics, prev_alerts: Optional[set] = None):
         alerts_local = [a for a in alerts_local if a["alert"] not in prev_alerts]
     return alerts_local
 
+def _rejected(device: str, error: ValueError):
+    """Error response for a snapshot the store cannot hold, so the agent sees it failed."""
+    status = (413 if isinstance(error, (SnapshotTooLarge, AlertStateTooLarge))
+              else 507 if isinstance(error, StoreFull) else 400)
+    logger.warning("Rejected metrics from %s (HTTP %s): %s", device, status, error)
+    return JSONResponse(status_code=status, content={"ok": False, "error": str(error)})
+
+def _reported_interval(data: dict) -> Optional[float]:
+    interval = data.get("interval_sec")
+    if isinstance(interval, (int, float)) and not isinstance(interval, bool) and interval > 0:
+        return float(interval)
+    return None
+
 @app.post("/metrics")
 async def receive_metrics(data: dict):
     device = data.get("agent_id") or data.get("device", "unknown")
     if "timestamp" not in data:
         data["timestamp"] = time.time()
-    with lock:
-        metrics_db.setdefault(device, []).append(data)
-        metrics_db[device] = metrics_db[device][-100:]
-        current_alerts = last_alert_state.get(device, set())
+    # Server clock, for queries by time range; agent clocks may drift
+    data["received_at"] = time.time()
+    try:
+        # Serialise before locking; the shared store only copies bytes under the lock
+        payload = store.encode(data)
+    except ValueError as e:
+        return _rejected(device, e)
+    with store.write_lock():
+        # New alerts and state are worked out first, so a state too large for the
+        # store rejects the report before anything is written. Liveness alerts in
+        # the state are not re-raised by check_abnormal, so they recover below.
+        current_alerts = store.alert_state(device)
+        new_alerts = []
         alert_objs = check_abnormal(data, prev_alerts=current_alerts)
         for alert in alert_objs:
-            alerts.append({
+            new_alerts.append({
                 "device": device,
                 "alert": alert["alert"],
                 "severity": alert["severity"],
@@ -109,23 +160,34 @@ async def receive_metrics(data: dict):
         active_alerts = set(a["alert"] for a in check_abnormal(data))
         for old_alert in list(current_alerts):
             if old_alert not in active_alerts:
-                alerts.append({
+                new_alerts.append({
                     "device": device,
                     "alert": f"{old_alert} - recovered",
                     "severity": "warning",
                     "timestamp": time.time()
                 })
                 current_alerts.remove(old_alert)
-        last_alert_state[device] = current_alerts
+        previous_seen = store.last_seen(device)
+        try:
+            state_payload = store.encode_state(current_alerts)
+            store.append(device, data, payload)
+        except ValueError as e:
+            return _rejected(device, e)
+        liveness.seen(device, previous_seen=previous_seen, interval=_reported_interval(data))
+        archived_agents.pop(device, None)
+        for alert in new_alerts:
+            store.add_alert(alert)
+        store.set_alert_state(device, current_alerts, state_payload)
     return {"ok": True}
 
 @app.get("/metrics")
 async def get_metrics():
     # Add sensors_temperature to the returned metrics for each agent
     result = []
-    for entries in metrics_db.values():
-        if entries:
-            latest = entries[-1]
+    with store.read_lock():
+        latest_all = [store.latest(device) for device in store.devices()]
+    for latest in latest_all:
+        if latest:
             # Ensure sensors_temperature is present (for backward compatibility)
             if "sensors_temperature" not in latest:
                 latest["sensors_temperature"] = {}
@@ -134,18 +196,166 @@ async def get_metrics():
 
 @app.get("/metrics/{agent_id}")
 async def get_metrics_for_agent(agent_id: str):
-    entries = metrics_db.get(agent_id)
-    if not entries:
+    with store.read_lock():
+        latest = store.latest(agent_id)
+    if not latest:
         return {}
-    latest = entries[-1]
     # Ensure sensors_temperature is present
     if "sensors_temperature" not in latest:
         latest["sensors_temperature"] = {}
     return latest
 
+# ---------- Shard endpoints (used by router.py to rebalance agents) ----------
+@app.get("/shard/agents")
+async def shard_agents():
+    with store.read_lock():
+        return store.devices()
+
+@app.get("/shard/export/{agent_id}")
+async def shard_export(agent_id: str):
+    with store.read_lock():
+        info = liveness.agents.get(agent_id) or {}
+        return {
+            "entries": store.entries(agent_id),
+            "alert_state": sorted(store.alert_state(agent_id)),
+            "last_seen": store.last_seen(agent_id),
+            "interval_sec": info.get("interval") if info.get("learned") else None,
+        }
+
+@app.post("/shard/import/{agent_id}")
+async def shard_import(agent_id: str, data: dict):
+    # Merge with anything already received for this agent since the ring changed
+    with store.write_lock():
+        # Keyed by receive time: a retried move may bring snapshots this shard already has
+        merged = {_received_at(e): e for e in data.get("entries", []) + store.entries(agent_id)}
+        entries = sorted(merged.values(), key=_received_at)
+        state = set(data.get("alert_state", [])) | store.alert_state(agent_id)
+        try:
+            state_payload = store.encode_state(state)
+        except ValueError as e:
+            return {"ok": False, "error": str(e)}
+        # Reports may already have reached this shard since the ring changed
+        last_seen = max(filter(None, (data.get("last_seen"), store.last_seen(agent_id))), default=None)
+        store.remove(agent_id)
+        forget_processes(agent_id)
+        try:
+            for e in entries[-store.history:]:
+                store.append(agent_id, e)
+        except ValueError as e:
+            return {"ok": False, "error": str(e)}
+        store.set_alert_state(agent_id, state, state_payload)
+        if last_seen:
+            store.set_last_seen(agent_id, last_seen)
+            liveness.restore(agent_id, last_seen, _reported_interval(data))
+            _liveness_alert(agent_id, liveness.agents[agent_id]["state"], time.time())
+    return {"ok": True}
+
+@app.delete("/shard/agents/{agent_id}")
+async def shard_remove(agent_id: str):
+    with store.write_lock():
+        store.remove(agent_id)
+        liveness.forget(agent_id)
+        forget_processes(agent_id)
+    return {"ok": True}
+
+# ---------- Agent liveness ----------
+def check_liveness(now: Optional[float] = None):
+    """Raise alerts for agents that went stale/down and evict long-dead ones."""
+    now = time.time() if now is None else now
+    with store.write_lock():
+        sync_liveness(now)
+        for device, old_state, new_state in liveness.expire(now, last_seen=store.last_seen):
+            last_seen = store.last_seen(device)
+            if last_seen is None:
+                # Already removed (by another worker or a shard move)
+                continue
+            if new_state == EVICTED:
+                archived_agents.add(device, {"last_seen": last_seen, "snapshot": store.latest(device)})
+                store.remove(device)
+                forget_processes(device)
+                store.add_alert({
+                    "device": device,
+                    "alert": f"Agent evicted after {int(now - last_seen)}s without reports",
+                    "severity": "warning",
+                    "timestamp": now
+                })
+                continue
+            _liveness_alert(device, new_state, now)
+
+def _liveness_alert(device: str, state: str, now: float):
+    """Raise the stale/down alert for `device` unless it is already active (caller holds write_lock)."""
+    current_alerts = store.alert_state(device)
+    new_alert = None
+    if state == STALE and STALE_ALERT not in current_alerts:
+        new_alert = {"alert": STALE_ALERT, "severity": "warning"}
+    elif state == DOWN and DOWN_ALERT not in current_alerts:
+        current_alerts.discard(STALE_ALERT)
+        new_alert = {"alert": DOWN_ALERT, "severity": "critical"}
+    if new_alert:
+        current_alerts.add(new_alert["alert"])
+        try:
+            state_payload = store.encode_state(current_alerts)
+        except ValueError as e:
+            logger.error("Cannot record '%s' for %s: %s", new_alert["alert"], device, e)
+            return
+        store.add_alert(dict(new_alert, device=device, timestamp=now))
+        store.set_alert_state(device, current_alerts, state_payload)
+
+def sync_liveness(now: Optional[float] = None):
+    """
+    With the shared store, each worker only sees the reports it received itself:
+    track agents that report to other workers (or did before a restart), take
+    their newer report times and drop agents another worker removed.
+    Caller holds a store lock.
+    """
+    if not store.shared:
+        return
+    now = time.time() if now is None else now
+    devices = store.devices()
+    for device in devices:
+        last_seen = store.last_seen(device)
+        if last_seen is None:
+            continue
+        if device not in liveness.agents:
+            latest = store.latest(device) or {}
+            liveness.restore(device, last_seen, _reported_interval(latest), now)
+        else:
+            liveness.refresh(device, last_seen, now)
+    for device in set(liveness.agents) - set(devices):
+        liveness.forget(device)
+
+async def liveness_loop():
+    while True:
+        await asyncio.sleep(1)
+        try:
+            check_liveness()
+        except Exception:
+            logger.exception("Liveness check failed")
+        try:
+            sync_process_history()
+        except Exception:
+            logger.exception("Process history sync failed")
+
+@app.get("/agents")
+async def get_agents():
+    """Liveness of every tracked agent plus the archive of evicted ones."""
+    with store.read_lock():
+        sync_liveness()
+    agents = [
+        {"agent_id": device, "state": info["state"], "last_seen": info["last_seen"], "interval_sec": round(info["interval"], 1)}
+        for device, info in list(liveness.agents.items())
+    ]
+    archived = [{"agent_id": device, "last_seen": rec["last_seen"]} for device, rec in list(archived_agents.items())]
+    return {"agents": agents, "archived": archived}
+
+@app.get("/agents/archived/{agent_id}")
+async def get_archived_agent(agent_id: str):
+    return archived_agents.get(agent_id) or {}
+
 @app.get("/alerts")
 async def get_alerts():
-    return alerts[-20:]
+    with store.read_lock():
+        return store.recent_alerts(20)
 
 @app.get("/")
 async def root():
@@ -153,10 +363,18 @@ async def root():
 
 @app.get("/health")
 async def health():
+    with store.read_lock():
+        devices_known = store.device_count()
+        total_alerts = store.alert_count()
+        sync_liveness()
+    counts = liveness.counts()
     return {
         "status": "ok",
-        "devices_reporting": len(metrics_db),
-        "total_alerts": len(alerts),
+        "devices_reporting": counts["up"],
+        "devices_stale": counts["stale"],
+        "devices_down": counts["down"],
+        "devices_known": devices_known,
+        "total_alerts": total_alerts,
         "server_time": time.time()
     }
 
@@ -181,14 +399,16 @@ async def get_gpu_info():
 @app.get("/history/{agent_id}")
 async def get_history(agent_id: str, samples: int = 24):
     """
-    Return exactly `samples` historical points (CPU & Memory).
+    Return exactly `samples` historical points (CPU & Memory, plus the
+    per-window peaks `cpu_max`/`mem_max` only if any of those points has a
+    sampling window).
     Returns fixed-size arrays, padding with the first available value or zero.
     """
-    if agent_id not in metrics_db:
+    with store.read_lock():
+        entries = store.entries(agent_id)
+    if not entries:
         return {"cpu": [0] * samples, "mem": [0] * samples, "interval_sec": 5}
     
-    entries = metrics_db[agent_id]
-    
     # Estimate interval from timestamps
     interval = 5  # default
     if len(entries) > 1:
@@ -202,6 +422,9 @@ async def get_history(agent_id: str, samples: int = 24):
     # Extract CPU and memory data from available entries
     cpu_data = []
     mem_data = []
+    # Per-window peaks from agents that pre-aggregate (fall back to the point value)
+    cpu_max_data = []
+    mem_max_data = []
     for e in entries:  # process all entries, we'll slice later
         cpu_val = 0
         mem_val = 0
@@ -209,22 +432,100 @@ async def get_history(agent_id: str, samples: int = 24):
             cpu_val = e["cpu"].get("total_percent", 0)
         if "memory" in e and isinstance(e["memory"], dict):
             mem_val = e["memory"].get("percent", 0)
+        window = e.get("window") if isinstance(e.get("window"), dict) else {}
         cpu_data.append(cpu_val)
         mem_data.append(mem_val)
+        cpu_max_data.append((window.get("cpu_percent") or {}).get("max", cpu_val))
+        mem_max_data.append((window.get("mem_percent") or {}).get("max", mem_val))
     
-    # Take the last 'samples' entries or pad if we have fewer
-    if len(cpu_data) >= samples:
-        cpu_result = cpu_data[-samples:]
-        mem_result = mem_data[-samples:]
+    result = {"interval_sec": interval}
+    series = [("cpu", cpu_data), ("mem", mem_data)]
+    if any(isinstance(e.get("window"), dict) for e in entries[-samples:]):
+        series += [("cpu_max", cpu_max_data), ("mem_max", mem_max_data)]
+    for key, data in series:
+        # Take the last 'samples' entries or pad with first value or zero to reach 'samples' length
+        if len(data) >= samples:
+            result[key] = data[-samples:]
+        else:
+            pad_value = data[0] if data else 0
+            result[key] = [pad_value] * (samples - len(data)) + data
+    return result
+
+@app.get("/export")
+async def export_metrics(agents: Optional[str] = None, fields: Optional[str] = None,
+                         start: Optional[float] = None, end: Optional[float] = None, format: str = "ndjson"):
+    """
+    Stream stored snapshots as NDJSON, CSV, or (with pyarrow) Arrow IPC / Parquet.
+    `agents` and `fields` are comma-separated; fields are dotted paths such as
+    `cpu.total_percent` or `window.cpu_percent.max`. Rows are generated lazily.
+    """
+    if format not in export.CONTENT_TYPES:
+        return JSONResponse(status_code=400, content={"error": f"unsupported format '{format}'", "formats": list(export.CONTENT_TYPES)})
+    field_list = export.parse_list(fields) or export.DEFAULT_FIELDS
+    if agents:
+        agent_list = export.parse_list(agents)
     else:
-        # Pad with first value or zero to reach 'samples' length
-        pad_value_cpu = cpu_data[0] if cpu_data else 0
-        pad_value_mem = mem_data[0] if mem_data else 0
-        padding_needed = samples - len(cpu_data)
-        cpu_result = [pad_value_cpu] * padding_needed + cpu_data
-        mem_result = [pad_value_mem] * padding_needed + mem_data
-    
-    return {"cpu": cpu_result, "mem": mem_result, "interval_sec": interval}
+        with store.read_lock():
+            agent_list = store.devices()
+    rows = export.iter_rows(store, agent_list, field_list, start, end)
+    if format == "ndjson":
+        body = export.to_ndjson(rows)
+    elif format == "csv":
+        body = export.to_csv(rows, field_list)
+    else:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return JSONResponse(status_code=400, content={"error": f"format '{format}' requires pyarrow"})
+        body = export.to_arrow(rows, field_list, format)
+    return StreamingResponse(body, media_type=export.CONTENT_TYPES[format],
+                             headers={"Content-Disposition": f"attachment; filename=metrics.{format}"})
+
+# ---------- Process history ----------
+def _received_at(entry: dict) -> float:
+    return entry.get("received_at") or entry.get("timestamp", 0)
+
+def forget_processes(device: str):
+    process_history.forget(device)
+    process_cursors.pop(device, None)
+
+def sync_process_history(devices: Optional[List[str]] = None):
+    """
+    Feed process_history from the snapshots appended to the store since the
+    last sync, whichever worker received them, so every worker answers from
+    the same rows. The liveness loop sweeps every device each second; queries
+    pass `devices` to catch up on just the agent they read. It only falls
+    behind if a worker misses more than the store's history per agent.
+    """
+    with store.read_lock():
+        if devices is None:
+            present = set(store.devices())
+            gone = [device for device in process_cursors if device not in present]
+        else:
+            present = {device for device in devices if store.last_seen(device) is not None}
+            gone = [device for device in devices if device not in present]
+        pending = {device: store.entries_since(device, process_cursors.get(device, 0)) for device in present}
+    for device in gone:
+        forget_processes(device)
+    for device, (entries, count) in pending.items():
+        last = process_history.last_timestamp(device)
+        for e in entries:
+            ts = _received_at(e)
+            # Skip rows already added (the agent was removed and re-added since the last sync)
+            if last is None or ts > last:
+                process_history.add(device, ts, e.get("processes"))
+        process_cursors[device] = count
+
+@app.get("/processes/{agent_id}/top")
+async def get_top_processes(agent_id: str, minutes: float = 60, by: str = "cpu", limit: int = 10):
+    """Processes with the highest average CPU (`by=cpu`) or memory (`by=mem`) over the last `minutes`."""
+    sync_process_history([agent_id])
+    return process_history.top(agent_id, since=time.time() - minutes * 60, by=by, limit=limit)
+
+@app.get("/processes/{agent_id}/pid/{pid}")
+async def get_process_series(agent_id: str, pid: int, minutes: float = 60):
+    sync_process_history([agent_id])
+    return {"pid": pid, "points": process_history.series(agent_id, pid, since=time.time() - minutes * 60)}
 
 def get_distro():
     if platform.system() == 'Linux':
@@ -274,18 +575,7 @@ def _is_port_open(port: int, host: str = "127.0.0.1", timeout: float = 0.5) -> b
         return False
 
 def _docker_status():
-    running = False
-    running_containers = 0
-    try:
-        # Check docker daemon
-        res = subprocess.run(["docker", "info"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=1)
-        running = (res.returncode == 0)
-        if running:
-            ps = subprocess.run(["docker", "ps", "-q"], capture_output=True, text=True, timeout=1)
-            running_containers = len([l for l in ps.stdout.splitlines() if l.strip()])
-    except Exception:
-        pass
-    return {"running": running, "running_containers": running_containers}
+    return agent.get_docker_status()
 
 def _uptime_seconds():
     # Linux fast path
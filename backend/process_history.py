@@ -0,0 +1,123 @@
+import bisect
+from array import array
+from typing import Dict, List, Optional
+
+class ProcessNames:
+    """Interns process names so each sample stores a 4-byte id instead of a string."""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def intern(self, name: str) -> int:
+        idx = self.ids.get(name)
+        if idx is None:
+            idx = len(self.names)
+            self.ids[name] = idx
+            self.names.append(name)
+        return idx
+
+class AgentProcesses:
+    """Column arrays of (timestamp, pid, name id, cpu, mem) rows in arrival order."""
+    __slots__ = ("ts", "pid", "name", "cpu", "mem")
+
+    def __init__(self):
+        self.ts = array("d")
+        self.pid = array("I")
+        self.name = array("I")
+        self.cpu = array("f")
+        self.mem = array("f")
+
+    def columns(self):
+        return (self.ts, self.pid, self.name, self.cpu, self.mem)
+
+class ProcessHistory:
+    """
+    Per-agent history of the top processes in each report, kept for
+    `retention` seconds. A row costs 24 bytes, against several hundred for
+    the raw process dict it replaces.
+    """
+
+    def __init__(self, retention: float = 3600):
+        self.retention = retention
+        self.names = ProcessNames()
+        self.agents: Dict[str, AgentProcesses] = {}
+
+    def add(self, device: str, timestamp: float, processes):
+        if not processes:
+            return
+        hist = self.agents.get(device)
+        if hist is None:
+            hist = self.agents[device] = AgentProcesses()
+        # Rows must stay time-ordered for bisect; late reports are clamped
+        if hist.ts and timestamp < hist.ts[-1]:
+            timestamp = hist.ts[-1]
+        for p in processes:
+            if not isinstance(p, dict) or p.get("pid") is None:
+                continue
+            hist.ts.append(timestamp)
+            hist.pid.append(int(p["pid"]) & 0xFFFFFFFF)
+            hist.name.append(self.names.intern(str(p.get("name") or "")))
+            hist.cpu.append(float(p.get("cpu") or 0))
+            hist.mem.append(float(p.get("memory") or 0))
+        self._trim(hist, timestamp - self.retention)
+
+    def _trim(self, hist: AgentProcesses, cutoff: float):
+        cut = bisect.bisect_left(hist.ts, cutoff)
+        # Drop expired rows in batches so deleting from the front stays amortised O(1)
+        if cut and (cut >= 1024 or cut * 4 >= len(hist.ts)):
+            for col in hist.columns():
+                del col[:cut]
+
+    def forget(self, device: str):
+        self.agents.pop(device, None)
+
+    def last_timestamp(self, device: str) -> Optional[float]:
+        hist = self.agents.get(device)
+        return hist.ts[-1] if hist is not None and hist.ts else None
+
+    def _start(self, hist: AgentProcesses, since: Optional[float]) -> int:
+        return bisect.bisect_left(hist.ts, since) if since is not None else 0
+
+    def top(self, device: str, since: Optional[float] = None, by: str = "cpu", limit: int = 10) -> List[dict]:
+        """Processes ranked by average CPU (or memory) over the rows since `since`."""
+        hist = self.agents.get(device)
+        if hist is None:
+            return []
+        agg: Dict[tuple, list] = {}
+        for i in range(self._start(hist, since), len(hist.ts)):
+            key = (hist.pid[i], hist.name[i])
+            cpu, mem = hist.cpu[i], hist.mem[i]
+            a = agg.get(key)
+            if a is None:
+                agg[key] = [1, cpu, cpu, mem, mem, hist.ts[i]]
+            else:
+                a[0] += 1
+                a[1] += cpu
+                a[2] = max(a[2], cpu)
+                a[3] += mem
+                a[4] = max(a[4], mem)
+                a[5] = hist.ts[i]
+        rows = [{
+            "pid": pid,
+            "name": self.names.names[name_id],
+            "samples": a[0],
+            "avg_cpu": round(a[1] / a[0], 2),
+            "max_cpu": round(a[2], 2),
+            "avg_mem": round(a[3] / a[0], 2),
+            "max_mem": round(a[4], 2),
+            "last_seen": a[5],
+        } for (pid, name_id), a in agg.items()]
+        key = "avg_mem" if by in ("mem", "memory") else "avg_cpu"
+        rows.sort(key=lambda r: r[key], reverse=True)
+        return rows[:limit]
+
+    def series(self, device: str, pid: int, since: Optional[float] = None) -> List[dict]:
+        hist = self.agents.get(device)
+        if hist is None:
+            return []
+        return [
+            {"timestamp": hist.ts[i], "name": self.names.names[hist.name[i]],
+             "cpu": round(hist.cpu[i], 2), "mem": round(hist.mem[i], 2)}
+            for i in range(self._start(hist, since), len(hist.ts)) if hist.pid[i] == pid
+        ]
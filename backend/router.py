@@ -0,0 +1,412 @@
+"""
+Sharding front-end: routes each agent to one backend instance (shard) by
+consistent hashing on agent_id and fans read queries out to every shard.
+
+    SYNCPULSE_SHARDS=http://127.0.0.1:8001,http://127.0.0.1:8002 uvicorn router:app --port 8000
+
+Shards are ordinary `main:app` instances. POST /shards adds a shard at
+runtime and moves the agents it now owns off their previous shards.
+Membership is saved to SYNCPULSE_SHARDS_FILE, which takes precedence over
+SYNCPULSE_SHARDS on restart and is re-read by every router worker.
+"""
+import bisect
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+import requests
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+
+logger = logging.getLogger("SyncPulseRouter")
+
+# ---------- Consistent hash ring ----------
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+class HashRing:
+    def __init__(self, nodes=(), replicas: int = 64):
+        self.replicas = replicas
+        self._keys: List[int] = []
+        self._owners: Dict[int, str] = {}
+        self.nodes: List[str] = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for i in range(self.replicas):
+            h = _hash(f"{node}#{i}")
+            self._owners[h] = node
+            bisect.insort(self._keys, h)
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.remove(node)
+        for i in range(self.replicas):
+            h = _hash(f"{node}#{i}")
+            self._owners.pop(h, None)
+            self._keys.remove(h)
+
+    def get(self, key: str) -> Optional[str]:
+        if not self._keys:
+            return None
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._owners[self._keys[i]]
+
+
+# ---------- Router app ----------
+app = FastAPI()
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# ---------- Shard membership (persisted, shared by router workers) ----------
+SHARDS_FILE = os.environ.get("SYNCPULSE_SHARDS_FILE",
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), "shards.json"))
+_ring_mtime = None
+
+def _save_membership(nodes: List[str]):
+    global _ring_mtime
+    tmp = f"{SHARDS_FILE}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"shards": nodes}, f)
+    os.replace(tmp, SHARDS_FILE)
+    _ring_mtime = os.stat(SHARDS_FILE).st_mtime_ns
+
+def _load_membership() -> HashRing:
+    """
+    Shards from SHARDS_FILE if it exists, else from SYNCPULSE_SHARDS. Shards
+    listed only in the environment are not added silently, since their agents
+    would not be moved; add them with POST /shards.
+    """
+    global _ring_mtime
+    env_nodes = [u.strip().rstrip("/") for u in os.environ.get("SYNCPULSE_SHARDS", "").split(",") if u.strip()]
+    try:
+        with open(SHARDS_FILE) as f:
+            nodes = json.load(f)["shards"]
+        _ring_mtime = os.stat(SHARDS_FILE).st_mtime_ns
+    except FileNotFoundError:
+        if env_nodes:
+            _save_membership(env_nodes)
+        return HashRing(env_nodes)
+    missing = [u for u in env_nodes if u not in nodes]
+    if missing:
+        logger.warning("Shards %s are in SYNCPULSE_SHARDS but not in %s; add them with POST /shards", missing, SHARDS_FILE)
+    return HashRing(nodes)
+
+def _sync_ring():
+    """Pick up membership changes made by another router worker (one stat() per request)."""
+    global ring
+    try:
+        mtime = os.stat(SHARDS_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return
+    if mtime != _ring_mtime:
+        ring = _load_membership()
+
+ring = _load_membership()
+rebalance_lock = threading.Lock()
+session = requests.Session()
+session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=32, pool_maxsize=64))
+pool = ThreadPoolExecutor(max_workers=32)
+TIMEOUT = float(os.environ.get("SYNCPULSE_SHARD_TIMEOUT", "5"))
+
+def _q(agent_id: str) -> str:
+    return quote(agent_id, safe="")
+
+def _get(shard: str, path: str, **params):
+    res = session.get(f"{shard}{path}", params=params, timeout=TIMEOUT)
+    res.raise_for_status()
+    return res.json()
+
+def _fanout(path: str, **params) -> Dict[str, object]:
+    """GET `path` on every shard concurrently; shards that fail map to None."""
+    _sync_ring()
+    shards = list(ring.nodes)
+    futures = {shard: pool.submit(_get, shard, path, **params) for shard in shards}
+    results = {}
+    for shard, fut in futures.items():
+        try:
+            results[shard] = fut.result()
+        except Exception as e:
+            logger.warning("Shard %s failed for %s: %s", shard, path, e)
+            results[shard] = None
+    return results
+
+def _first_shard() -> Optional[str]:
+    return ring.nodes[0] if ring.nodes else None
+
+def _owner(agent_id: str) -> Optional[str]:
+    _sync_ring()
+    return ring.get(agent_id)
+
+def _dedupe(per_shard: Dict[str, object], key: str) -> List[dict]:
+    """
+    Merge per-shard lists of agent records. An agent found on several shards
+    (a move whose cleanup failed) is taken from the shard that owns it.
+    """
+    merged: Dict[str, dict] = {}
+    for shard, items in per_shard.items():
+        for item in items or []:
+            agent_id = item.get(key)
+            if agent_id not in merged or ring.get(agent_id) == shard:
+                merged[agent_id] = item
+    return list(merged.values())
+
+# Endpoints are plain `def` so FastAPI runs the blocking shard calls in its threadpool
+@app.post("/metrics")
+def receive_metrics(data: dict):
+    device = data.get("agent_id") or data.get("device", "unknown")
+    shard = _owner(device)
+    if shard is None:
+        return JSONResponse(status_code=503, content={"ok": False, "error": "no shards configured"})
+    try:
+        res = session.post(f"{shard}/metrics", json=data, timeout=TIMEOUT)
+        # Pass the shard's status through so agents see rejected reports
+        return JSONResponse(status_code=res.status_code, content=res.json())
+    except Exception as e:
+        return JSONResponse(status_code=502, content={"ok": False, "error": f"shard {shard} unavailable: {e}"})
+
+@app.get("/metrics")
+def get_metrics():
+    return _dedupe(_fanout("/metrics"), "agent_id")
+
+@app.get("/metrics/{agent_id}")
+def get_metrics_for_agent(agent_id: str):
+    shard = _owner(agent_id)
+    try:
+        return _get(shard, f"/metrics/{_q(agent_id)}") if shard else {}
+    except Exception:
+        return {}
+
+@app.get("/history/{agent_id}")
+def get_history(agent_id: str, samples: int = 24):
+    shard = _owner(agent_id)
+    try:
+        return _get(shard, f"/history/{_q(agent_id)}", samples=samples)
+    except Exception:
+        return {"cpu": [0] * samples, "mem": [0] * samples, "interval_sec": 5}
+
+@app.get("/processes/{agent_id}/top")
+def get_top_processes(agent_id: str, minutes: float = 60, by: str = "cpu", limit: int = 10):
+    shard = _owner(agent_id)
+    try:
+        return _get(shard, f"/processes/{_q(agent_id)}/top", minutes=minutes, by=by, limit=limit) if shard else []
+    except Exception:
+        return []
+
+@app.get("/processes/{agent_id}/pid/{pid}")
+def get_process_series(agent_id: str, pid: int, minutes: float = 60):
+    shard = _owner(agent_id)
+    try:
+        return _get(shard, f"/processes/{_q(agent_id)}/pid/{pid}", minutes=minutes) if shard else {"pid": pid, "points": []}
+    except Exception:
+        return {"pid": pid, "points": []}
+
+@app.get("/alerts")
+def get_alerts():
+    merged = []
+    for alerts in _fanout("/alerts").values():
+        if alerts:
+            merged.extend(alerts)
+    merged.sort(key=lambda a: a.get("timestamp", 0))
+    return merged[-20:]
+
+@app.get("/")
+def root():
+    return {"msg": "Router is running", "shards": ring.nodes}
+
+@app.get("/health")
+def health():
+    results = _fanout("/health")
+    healthy = [h for h in results.values() if h]
+    return {
+        "status": "ok" if len(healthy) == len(results) else "degraded",
+        "devices_reporting": sum(h.get("devices_reporting", 0) for h in healthy),
+        "devices_stale": sum(h.get("devices_stale", 0) for h in healthy),
+        "devices_down": sum(h.get("devices_down", 0) for h in healthy),
+        "devices_known": sum(h.get("devices_known", 0) for h in healthy),
+        "total_alerts": sum(h.get("total_alerts", 0) for h in healthy),
+        "server_time": max((h.get("server_time", 0) for h in healthy), default=0),
+        "shards": {shard: ("ok" if h else "unreachable") for shard, h in results.items()},
+    }
+
+@app.get("/export")
+def export_metrics(agents: Optional[str] = None, fields: Optional[str] = None,
+                   start: Optional[float] = None, end: Optional[float] = None, format: str = "ndjson"):
+    """Chain the shards' export streams; only line-based formats can be concatenated."""
+    if format not in ("ndjson", "csv"):
+        return JSONResponse(status_code=400, content={"error": f"the router can only merge ndjson and csv exports, query a shard for '{format}'"})
+    params = {k: v for k, v in (("fields", fields), ("start", start), ("end", end), ("format", format)) if v is not None}
+    _sync_ring()
+    targets = []
+    if agents:
+        owned: Dict[str, List[str]] = {}
+        for agent_id in [a.strip() for a in agents.split(",") if a.strip()]:
+            owned.setdefault(ring.get(agent_id), []).append(agent_id)
+        targets = [(shard, dict(params, agents=",".join(ids))) for shard, ids in owned.items() if shard]
+    else:
+        targets = [(shard, params) for shard in ring.nodes]
+
+    # Open every shard's stream and check its status before sending the first
+    # byte, so a failing shard turns into an error rather than missing rows
+    responses = []
+    try:
+        for shard, shard_params in targets:
+            res = session.get(f"{shard}/export", params=shard_params, stream=True, timeout=TIMEOUT)
+            responses.append(res)
+            res.raise_for_status()
+    except Exception as e:
+        for res in responses:
+            res.close()
+        logger.warning("Export from %s failed: %s", shard, e)
+        return JSONResponse(status_code=502, content={"error": f"export from shard {shard} failed: {e}"})
+
+    def body():
+        # CSV: only the first shard contributes its header row
+        header_sent = False
+        try:
+            for (shard, _), res in zip(targets, responses):
+                skip_header = format == "csv" and header_sent
+                try:
+                    for chunk in res.iter_content(chunk_size=65536):
+                        if skip_header:
+                            nl = chunk.find(b"\n")
+                            if nl < 0:
+                                continue
+                            chunk = chunk[nl + 1:]
+                            skip_header = False
+                        if chunk:
+                            header_sent = True
+                            yield chunk
+                except Exception as e:
+                    # Headers are already sent: abort the response so the client sees an incomplete transfer
+                    logger.error("Export from %s failed mid-stream: %s", shard, e)
+                    raise
+        finally:
+            for res in responses:
+                res.close()
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    return StreamingResponse(body(), media_type=media_type,
+                             headers={"Content-Disposition": f"attachment; filename=metrics.{format}"})
+
+@app.get("/agents")
+def get_agents():
+    results = _fanout("/agents")
+    return {
+        "agents": _dedupe({shard: (res or {}).get("agents") for shard, res in results.items()}, "agent_id"),
+        "archived": _dedupe({shard: (res or {}).get("archived") for shard, res in results.items()}, "agent_id"),
+    }
+
+@app.get("/agents/archived/{agent_id}")
+def get_archived_agent(agent_id: str):
+    # Evicted agents are archived on the shard that owned them
+    for res in _fanout(f"/agents/archived/{_q(agent_id)}").values():
+        if res:
+            return res
+    return {}
+
+# Host-level endpoints describe the machine a backend runs on; served by the first shard
+def _host_endpoint(path: str):
+    shard = _first_shard()
+    try:
+        return _get(shard, path) if shard else {}
+    except Exception:
+        return {}
+
+@app.get("/gpu")
+def get_gpu_info():
+    return _host_endpoint("/gpu") or {"gpus": []}
+
+@app.get("/overview")
+def get_overview():
+    return _host_endpoint("/overview")
+
+@app.get("/services")
+def services():
+    return _host_endpoint("/services")
+
+@app.get("/all")
+def get_all(agent_id: Optional[str] = None, samples: int = 24):
+    return {
+        "health": health(),
+        "metrics": get_metrics(),
+        "overview": get_overview(),
+        "gpu": get_gpu_info(),
+        "services": services(),
+        "history": get_history(agent_id, samples) if agent_id else None,
+    }
+
+# ---------- Shard membership ----------
+@app.get("/shards")
+def list_shards():
+    _sync_ring()
+    return {"shards": ring.nodes}
+
+def _rebalance() -> dict:
+    """
+    Move every agent found on a shard that does not own it to its owner.
+    Covers the agents a new shard takes over as well as moves that failed
+    earlier; caller holds rebalance_lock.
+    """
+    moved = 0
+    failed = []
+    unreachable = []
+    for shard in list(ring.nodes):
+        try:
+            agent_ids = _get(shard, "/shard/agents")
+        except Exception as e:
+            logger.warning("Cannot list agents on %s: %s", shard, e)
+            unreachable.append(shard)
+            continue
+        for agent_id in agent_ids:
+            owner = ring.get(agent_id)
+            if owner == shard:
+                continue
+            try:
+                state = _get(shard, f"/shard/export/{_q(agent_id)}")
+                res = session.post(f"{owner}/shard/import/{_q(agent_id)}", json=state, timeout=TIMEOUT)
+                if res.status_code >= 400 or not res.json().get("ok"):
+                    raise RuntimeError(f"import returned HTTP {res.status_code}: {res.text[:200]}")
+                res = session.delete(f"{shard}/shard/agents/{_q(agent_id)}", timeout=TIMEOUT)
+                res.raise_for_status()
+                moved += 1
+            except Exception as e:
+                # Reads prefer the owning shard, so a leftover copy on `shard` is not served twice
+                logger.warning("Failed to move %s from %s to %s: %s", agent_id, shard, owner, e)
+                failed.append(agent_id)
+    return {"ok": not failed and not unreachable, "moved": moved, "failed": failed,
+            "unreachable": unreachable, "shards": ring.nodes}
+
+@app.post("/shards")
+def add_shard(data: dict):
+    """
+    Add a shard and move the agents it now owns from their current shards.
+    The new membership is saved before agents move, so reports that arrive
+    meanwhile already go to the new shard and are merged on import. Posting
+    a shard that is already a member retries any moves that failed.
+    """
+    url = (data.get("url") or "").strip().rstrip("/")
+    if not url:
+        return JSONResponse(status_code=400, content={"ok": False, "error": "url is required"})
+    with rebalance_lock:
+        _sync_ring()
+        if url not in ring.nodes:
+            ring.add(url)
+            _save_membership(ring.nodes)
+        return _rebalance()
@@ -0,0 +1,387 @@
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional, Tuple
+
+HISTORY_LEN = 100
+
+class SnapshotTooLarge(ValueError):
+    """The serialised snapshot does not fit in a store slot."""
+
+class StoreFull(ValueError):
+    """No free agent slot is left in the store."""
+
+class AlertStateTooLarge(ValueError):
+    """A device's set of active alerts does not fit in its state slot."""
+
+# ---------- In-process store (single worker) ----------
+class MemoryStore:
+    """Keeps snapshots, alerts and alert state in plain dicts/lists of this process."""
+
+    # Only this process writes to it, so its own liveness tracker sees every report
+    shared = False
+
+    def __init__(self, history: int = HISTORY_LEN):
+        self.history = history
+        self.metrics_db: Dict[str, List[dict]] = {}
+        self.alerts: List[dict] = []
+        self.last_alert_state: Dict[str, set] = {}
+        self.seen: Dict[str, float] = {}
+        # Snapshots ever appended per device, for entries_since()
+        self.counts: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def write_lock(self):
+        return self.lock
+
+    def read_lock(self):
+        return nullcontext()
+
+    def encode(self, data: dict) -> None:
+        # Snapshots are kept as objects; nothing to serialise
+        return None
+
+    def append(self, device: str, data: dict, payload: Optional[bytes] = None):
+        entries = self.metrics_db.setdefault(device, [])
+        entries.append(data)
+        if len(entries) > self.history:
+            del entries[:-self.history]
+        self.seen[device] = time.time()
+        self.counts[device] = self.counts.get(device, 0) + 1
+
+    def entries(self, device: str) -> List[dict]:
+        return list(self.metrics_db.get(device) or [])
+
+    def entries_since(self, device: str, seq: int) -> Tuple[List[dict], int]:
+        """Snapshots appended after the first `seq` (as many as are still kept), and the new count."""
+        count = self.counts.get(device, 0)
+        if seq > count:
+            seq = 0
+        new = count - seq
+        return (list(self.metrics_db[device][-new:]) if new else []), count
+
+    def latest(self, device: str) -> Optional[dict]:
+        entries = self.metrics_db.get(device)
+        return entries[-1] if entries else None
+
+    def devices(self) -> List[str]:
+        return list(self.metrics_db.keys())
+
+    def last_seen(self, device: str) -> Optional[float]:
+        return self.seen.get(device)
+
+    def set_last_seen(self, device: str, timestamp: float):
+        if device in self.metrics_db:
+            self.seen[device] = timestamp
+
+    def remove(self, device: str):
+        self.metrics_db.pop(device, None)
+        self.last_alert_state.pop(device, None)
+        self.seen.pop(device, None)
+        self.counts.pop(device, None)
+
+    def device_count(self) -> int:
+        return len(self.metrics_db)
+
+    def alert_state(self, device: str) -> set:
+        return set(self.last_alert_state.get(device, set()))
+
+    def encode_state(self, state: set) -> None:
+        return None
+
+    def set_alert_state(self, device: str, state: set, payload: Optional[bytes] = None):
+        self.last_alert_state[device] = set(state)
+
+    def add_alert(self, alert: dict):
+        self.alerts.append(alert)
+
+    def recent_alerts(self, n: int) -> List[dict]:
+        return self.alerts[-n:]
+
+    def alert_count(self) -> int:
+        return len(self.alerts)
+
+
+# ---------- Shared-memory store (uvicorn --workers N) ----------
+# Layout of the segment:
+#   header | agent index | per-agent alert state | alert ring | per-agent snapshot rings
+# Every snapshot/alert/state is stored as length-prefixed JSON in a fixed-size slot.
+_MAGIC = b"SYNCPLS2"
+_HEADER = struct.Struct("<8sIIIIIIQ")  # magic, max_agents, history, slot_size, state_size, alert_capacity, alert_size, alerts_total
+_AGENT = struct.Struct("<H126sQd")      # id length (0 = free), id, snapshots appended, last append time
+_LEN = struct.Struct("<I")
+_MAX_ID = 126
+
+
+class SharedMetricsStore:
+    """
+    Snapshot store backed by multiprocessing.shared_memory so that several
+    backend worker processes ingest into and read from the same dataset.
+    Cross-process access is serialised with flock on a sidecar lock file:
+    readers take a shared lock, writers an exclusive one.
+    """
+
+    shared = True
+
+    def __init__(self, name: str = "syncpulse", max_agents: int = 64, history: int = HISTORY_LEN,
+                 slot_size: int = 16384, state_size: int = 2048,
+                 alert_capacity: int = 1024, alert_size: int = 512):
+        import fcntl
+        from multiprocessing import shared_memory, resource_tracker
+
+        self._fcntl = fcntl
+        self.name = name
+        self.max_agents = max_agents
+        self.history = history
+        self.slot_size = slot_size
+        self.state_size = state_size
+        self.alert_capacity = alert_capacity
+        self.alert_size = alert_size
+
+        self._index_off = _HEADER.size
+        self._state_off = self._index_off + max_agents * _AGENT.size
+        self._alert_off = self._state_off + max_agents * state_size
+        self._data_off = self._alert_off + alert_capacity * alert_size
+        size = self._data_off + max_agents * history * slot_size
+
+        self._thread_lock = threading.Lock()
+        self._lock_fd = os.open(os.path.join(tempfile.gettempdir(), f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        # Worker-local cache of agent_id -> index slot, validated on every use
+        self._index: Dict[str, int] = {}
+
+        with self._flock(fcntl.LOCK_EX):
+            try:
+                self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+                created = True
+            except FileExistsError:
+                self._shm = shared_memory.SharedMemory(name=name)
+                created = False
+            # The segment must outlive any single worker; it is removed via unlink()
+            try:
+                resource_tracker.unregister(self._shm._name, "shared_memory")
+            except Exception:
+                pass
+            self._buf = self._shm.buf
+            expected = (_MAGIC, max_agents, history, slot_size, state_size, alert_capacity, alert_size)
+            if created:
+                _HEADER.pack_into(self._buf, 0, *expected, 0)
+            else:
+                found = _HEADER.unpack_from(self._buf, 0)[:7]
+                if found != expected:
+                    raise RuntimeError(
+                        f"Shared memory segment '{name}' was created with a different layout; "
+                        f"remove it (/dev/shm/{name}) or change SYNCPULSE_SHM_NAME")
+
+    @contextmanager
+    def _flock(self, mode):
+        with self._thread_lock:
+            self._fcntl.flock(self._lock_fd, mode)
+            try:
+                yield
+            finally:
+                self._fcntl.flock(self._lock_fd, self._fcntl.LOCK_UN)
+
+    def write_lock(self):
+        return self._flock(self._fcntl.LOCK_EX)
+
+    def read_lock(self):
+        return self._flock(self._fcntl.LOCK_SH)
+
+    def close(self):
+        self._buf = None
+        self._shm.close()
+        os.close(self._lock_fd)
+
+    def unlink(self):
+        self._shm.unlink()
+
+    # ----- slot helpers -----
+    def _read_blob(self, off: int) -> Optional[bytes]:
+        (n,) = _LEN.unpack_from(self._buf, off)
+        if n == 0:
+            return None
+        return bytes(self._buf[off + _LEN.size:off + _LEN.size + n])
+
+    def _write_blob(self, off: int, size: int, payload: bytes):
+        if len(payload) + _LEN.size > size:
+            raise ValueError(f"payload of {len(payload)} bytes exceeds slot size {size}")
+        self._buf[off + _LEN.size:off + _LEN.size + len(payload)] = payload
+        _LEN.pack_into(self._buf, off, len(payload))
+
+    def _read_id(self, idx: int) -> Optional[str]:
+        n, raw, _, _ = _AGENT.unpack_from(self._buf, self._index_off + idx * _AGENT.size)
+        return raw[:n].decode() if n else None
+
+    def _count(self, idx: int) -> int:
+        return _AGENT.unpack_from(self._buf, self._index_off + idx * _AGENT.size)[2]
+
+    def _set_count(self, idx: int, count: int):
+        n, raw, _, _ = _AGENT.unpack_from(self._buf, self._index_off + idx * _AGENT.size)
+        _AGENT.pack_into(self._buf, self._index_off + idx * _AGENT.size, n, raw, count, time.time())
+
+    def _slot_of(self, device: str, create: bool = False) -> Optional[int]:
+        idx = self._index.get(device)
+        if idx is not None and self._read_id(idx) == device:
+            return idx
+        self._index.pop(device, None)
+        free = None
+        for i in range(self.max_agents):
+            name = self._read_id(i)
+            if name == device:
+                self._index[device] = i
+                return i
+            if name is None and free is None:
+                free = i
+        if not create:
+            return None
+        if free is None:
+            raise StoreFull(f"shared store is full ({self.max_agents} agents)")
+        raw = device.encode()
+        if len(raw) > _MAX_ID:
+            raise ValueError(f"agent id longer than {_MAX_ID} bytes")
+        _AGENT.pack_into(self._buf, self._index_off + free * _AGENT.size, len(raw), raw, 0, 0.0)
+        _LEN.pack_into(self._buf, self._state_off + free * self.state_size, 0)
+        self._index[device] = free
+        return free
+
+    def _data_slot(self, idx: int, seq: int) -> int:
+        return self._data_off + (idx * self.history + seq % self.history) * self.slot_size
+
+    # ----- store API (callers hold read_lock/write_lock, except for encode) -----
+    def encode(self, data: dict) -> bytes:
+        """Serialise a snapshot for append(); call it before taking the write lock."""
+        payload = json.dumps(data, separators=(",", ":")).encode()
+        if len(payload) + _LEN.size > self.slot_size:
+            raise SnapshotTooLarge(f"snapshot of {len(payload)} bytes exceeds slot size {self.slot_size}")
+        return payload
+
+    def append(self, device: str, data: dict, payload: Optional[bytes] = None):
+        if payload is None:
+            payload = self.encode(data)
+        idx = self._slot_of(device, create=True)
+        count = self._count(idx)
+        self._write_blob(self._data_slot(idx, count), self.slot_size, payload)
+        self._set_count(idx, count + 1)
+
+    def entries(self, device: str) -> List[dict]:
+        idx = self._slot_of(device)
+        if idx is None:
+            return []
+        count = self._count(idx)
+        start = max(0, count - self.history)
+        return [json.loads(self._read_blob(self._data_slot(idx, seq))) for seq in range(start, count)]
+
+    def entries_since(self, device: str, seq: int) -> Tuple[List[dict], int]:
+        """Snapshots appended after the first `seq` (as many as are still kept), and the new count."""
+        idx = self._slot_of(device)
+        if idx is None:
+            return [], 0
+        count = self._count(idx)
+        if seq > count:
+            seq = 0
+        start = max(seq, count - self.history)
+        return [json.loads(self._read_blob(self._data_slot(idx, s))) for s in range(start, count)], count
+
+    def latest(self, device: str) -> Optional[dict]:
+        idx = self._slot_of(device)
+        if idx is None:
+            return None
+        count = self._count(idx)
+        if not count:
+            return None
+        return json.loads(self._read_blob(self._data_slot(idx, count - 1)))
+
+    def devices(self) -> List[str]:
+        return [name for name in (self._read_id(i) for i in range(self.max_agents)) if name is not None]
+
+    def device_count(self) -> int:
+        return len(self.devices())
+
+    def last_seen(self, device: str) -> Optional[float]:
+        idx = self._slot_of(device)
+        if idx is None:
+            return None
+        return _AGENT.unpack_from(self._buf, self._index_off + idx * _AGENT.size)[3] or None
+
+    def set_last_seen(self, device: str, timestamp: float):
+        idx = self._slot_of(device)
+        if idx is None:
+            return
+        n, raw, count, _ = _AGENT.unpack_from(self._buf, self._index_off + idx * _AGENT.size)
+        _AGENT.pack_into(self._buf, self._index_off + idx * _AGENT.size, n, raw, count, timestamp)
+
+    def remove(self, device: str):
+        idx = self._slot_of(device)
+        if idx is None:
+            return
+        _AGENT.pack_into(self._buf, self._index_off + idx * _AGENT.size, 0, b"", 0, 0.0)
+        _LEN.pack_into(self._buf, self._state_off + idx * self.state_size, 0)
+        self._index.pop(device, None)
+
+    def alert_state(self, device: str) -> set:
+        idx = self._slot_of(device)
+        if idx is None:
+            return set()
+        blob = self._read_blob(self._state_off + idx * self.state_size)
+        return set(json.loads(blob)) if blob else set()
+
+    def encode_state(self, state: set) -> bytes:
+        """Serialise an alert state for set_alert_state(); check it before changing anything else."""
+        payload = json.dumps(sorted(state)).encode() if state else b""
+        if len(payload) + _LEN.size > self.state_size:
+            raise AlertStateTooLarge(f"alert state of {len(payload)} bytes exceeds state size {self.state_size}")
+        return payload
+
+    def set_alert_state(self, device: str, state: set, payload: Optional[bytes] = None):
+        if payload is None:
+            payload = self.encode_state(state)
+        idx = self._slot_of(device, create=True)
+        off = self._state_off + idx * self.state_size
+        if payload:
+            self._write_blob(off, self.state_size, payload)
+        else:
+            _LEN.pack_into(self._buf, off, 0)
+
+    def _alerts_total(self) -> int:
+        return _HEADER.unpack_from(self._buf, 0)[7]
+
+    def add_alert(self, alert: dict):
+        total = self._alerts_total()
+        off = self._alert_off + (total % self.alert_capacity) * self.alert_size
+        payload = json.dumps(alert).encode()
+        text = str(alert.get("alert", ""))
+        # Alert log entries are informational; shorten the text rather than fail the caller
+        while len(payload) + _LEN.size > self.alert_size and text:
+            text = text[:max(0, len(text) - (len(payload) + _LEN.size - self.alert_size) - 3)]
+            payload = json.dumps(dict(alert, alert=text + "...")).encode()
+        self._write_blob(off, self.alert_size, payload)
+        header = _HEADER.unpack_from(self._buf, 0)
+        _HEADER.pack_into(self._buf, 0, *header[:7], total + 1)
+
+    def recent_alerts(self, n: int) -> List[dict]:
+        total = self._alerts_total()
+        start = max(0, total - min(n, self.alert_capacity))
+        return [json.loads(self._read_blob(self._alert_off + (seq % self.alert_capacity) * self.alert_size))
+                for seq in range(start, total)]
+
+    def alert_count(self) -> int:
+        return self._alerts_total()
+
+
+def open_store():
+    """
+    Pick the store from the environment. SYNCPULSE_STORE=shm enables the
+    shared-memory store so `uvicorn main:app --workers N` serves one dataset.
+    """
+    if os.environ.get("SYNCPULSE_STORE", "memory").lower() != "shm":
+        return MemoryStore()
+    return SharedMetricsStore(
+        name=os.environ.get("SYNCPULSE_SHM_NAME", "syncpulse"),
+        max_agents=int(os.environ.get("SYNCPULSE_SHM_AGENTS", "64")),
+        slot_size=int(os.environ.get("SYNCPULSE_SHM_SLOT_BYTES", "16384")),
+        state_size=int(os.environ.get("SYNCPULSE_SHM_STATE_BYTES", "2048")),
+    )
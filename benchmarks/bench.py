@@ -0,0 +1,306 @@
+"""
+Benchmarks for the agent collection path and the backend hot paths.
+
+    python benchmarks/bench.py                                # run all, write benchmarks/results.json
+    python benchmarks/bench.py --only history --quick         # subset, fewer repetitions
+    python benchmarks/bench.py --baseline baseline.json       # compare; exit 1 on regressions
+
+psutil and GPU sources are replaced by fixed fakes for the collect_metrics
+cases so numbers do not depend on the machine's current load.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+from collections import namedtuple
+from types import SimpleNamespace
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "agent"))
+sys.path.insert(0, os.path.join(ROOT, "backend"))
+
+import agent  # noqa: E402
+import main  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from liveness import Archive, LivenessTracker  # noqa: E402
+from process_history import ProcessHistory  # noqa: E402
+from store import MemoryStore  # noqa: E402
+
+# Real sources, kept for the hot-counter comparison before the stubs are installed
+_real_psutil = agent.psutil
+_real_proc = agent._proc
+
+# ---------- Deterministic psutil / GPU stubs ----------
+_vmem = namedtuple("svmem", "total available percent used free")
+_swap = namedtuple("sswap", "total used free percent sin sout")
+_part = namedtuple("sdiskpart", "device mountpoint fstype opts")
+_usage = namedtuple("sdiskusage", "total used free percent")
+_diskio = namedtuple("sdiskio", "read_count write_count read_bytes write_bytes")
+_netio = namedtuple("snetio", "bytes_sent bytes_recv packets_sent packets_recv errin errout dropin dropout")
+_temp = namedtuple("shwtemp", "label current high critical")
+_cputimes = namedtuple("scputimes", "user nice system idle iowait")
+
+class _FakeProcess:
+    def __init__(self, i):
+        self.info = {
+            "pid": 1000 + i,
+            "name": f"proc-{i}",
+            "cpu_percent": float(i % 40),
+            "memory_percent": float(i % 13) / 2,
+            "status": "sleeping",
+        }
+
+_PROCS = [_FakeProcess(i) for i in range(300)]
+
+def fake_psutil():
+    return SimpleNamespace(
+        STATUS_ZOMBIE="zombie",
+        boot_time=lambda: 1_700_000_000.0,
+        getloadavg=lambda: (0.5, 0.4, 0.3),
+        cpu_percent=lambda percpu=False: [12.5] * 16 if percpu else 12.5,
+        cpu_times=lambda percpu=False: [_cputimes(100.0, 0.0, 25.0, 875.0, 0.0)] * 16 if percpu else _cputimes(1600.0, 0.0, 400.0, 14000.0, 0.0),
+        virtual_memory=lambda: _vmem(32 << 30, 20 << 30, 37.5, 12 << 30, 18 << 30),
+        swap_memory=lambda: _swap(8 << 30, 1 << 30, 7 << 30, 12.5, 0, 0),
+        disk_partitions=lambda all=False: [_part(f"/dev/sd{c}1", m, "ext4", "rw") for c, m in zip("abc", ("/", "/home", "/var"))],
+        disk_usage=lambda mountpoint: _usage(500 << 30, 200 << 30, 300 << 30, 40.0),
+        disk_io_counters=lambda perdisk=False: {f"sd{c}1": _diskio(1000, 2000, 10 << 20, 20 << 20) for c in "abc"},
+        net_io_counters=lambda pernic=False: {n: _netio(1 << 30, 2 << 30, 10 ** 6, 2 * 10 ** 6, 0, 0, 0, 0) for n in ("lo", "eth0", "wlan0")},
+        net_if_addrs=lambda: {"lo": [], "eth0": [], "wlan0": []},
+        sensors_temperatures=lambda fahrenheit=False: {"coretemp": [_temp(f"Core {i}", 45.0, 80.0, 95.0) for i in range(8)]},
+        process_iter=lambda attrs=None: iter(_PROCS),
+    )
+
+def install_agent_stubs():
+    agent.psutil = fake_psutil()
+    agent._proc = None
+    agent._cpu_meter = agent.CpuMeter()
+    agent.get_unique_id = lambda: "bench-agent"
+    agent.get_cpu_name = lambda: "Bench CPU @ 3.0GHz"
+    agent.get_all_gpus = lambda: [{"vendor": "NVIDIA", "name": "Bench GPU", "load": 10.0,
+                                   "used_memory_MB": 1024, "total_memory_MB": 8192, "temperature_C": 50}]
+    agent.get_inode_usage = lambda mountpoint: {"total": 1000000, "used": 10000, "free": 990000, "percent": 1.0}
+    agent.get_container_stats = lambda: [{
+        "id": f"{i:012x}", "name": f"svc-{i}", "image": "bench:latest", "state": "running", "status": "Up",
+        "cpu_percent": 1.5, "memory_usage": 64 << 20, "memory_limit": 1 << 30, "memory_percent": 6.25,
+        "net_rx_bytes": 1 << 20, "net_tx_bytes": 1 << 20, "blkio_read_bytes": 0, "blkio_write_bytes": 0, "pids": 4,
+    } for i in range(5)]
+
+def sample_snapshot(agent_id="bench-agent", ts=None):
+    data = agent.collect_metrics()
+    data["agent_id"] = agent_id
+    if ts is not None:
+        data["timestamp"] = ts
+    return data
+
+# ---------- Timing ----------
+# One loop for calling the async endpoints so asyncio.run() setup is not timed
+loop = asyncio.new_event_loop()
+
+def measure(fn, number, repeat):
+    """Min/median/mean seconds per call over `repeat` rounds of `number` calls."""
+    fn()  # warm-up
+    per_call = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((time.perf_counter() - t0) / number)
+    return {
+        "median_s": statistics.median(per_call),
+        "min_s": min(per_call),
+        "mean_s": statistics.mean(per_call),
+        "number": number,
+        "repeat": repeat,
+    }
+
+def fresh_store(history=100):
+    """Empty store plus the per-agent state receive_metrics builds next to it."""
+    main.store = MemoryStore(history=history)
+    main.liveness = LivenessTracker()
+    main.archived_agents = Archive()
+    main.process_history = ProcessHistory(retention=main.process_history.retention)
+    main.process_cursors.clear()
+    return main.store
+
+def fill_store(n_agents, per_agent, snapshot):
+    for a in range(n_agents):
+        for i in range(per_agent):
+            main.store.append(f"agent-{a}", dict(snapshot, agent_id=f"agent-{a}", timestamp=1_700_000_000 + i * 5))
+
+# ---------- Cases ----------
+def bench_collect_metrics(scale):
+    return {"agent.collect_metrics": measure(agent.collect_metrics, 20, 5 * scale)}
+
+def bench_hot_counters(scale):
+    """Real CPU/memory/disk/net counter reads: /proc fast path (Linux only) vs psutil."""
+    ps = _real_psutil
+
+    def via_psutil():
+        ps.cpu_percent(percpu=True)
+        ps.cpu_percent()
+        ps.virtual_memory()
+        ps.swap_memory()
+        ps.disk_io_counters(perdisk=True)
+        ps.net_io_counters(pernic=True)
+
+    results = {"agent.hot_counters[psutil]": measure(via_psutil, 200, 5 * scale)}
+    if _real_proc:
+        p = _real_proc
+        results["agent.hot_counters[/proc]"] = measure(
+            lambda: (p.cpu_times(), p.memory(), p.disk_io(), p.net_io()), 200, 5 * scale)
+    return results
+
+def bench_check_abnormal(scale):
+    snap = sample_snapshot()
+    hot = dict(snap, cpu={"total_percent": 97}, memory=dict(snap["memory"], percent=95, swap_percent=60))
+    return {
+        "backend.check_abnormal[normal]": measure(lambda: main.check_abnormal(snap), 1000, 5 * scale),
+        "backend.check_abnormal[alerting]": measure(lambda: main.check_abnormal(hot, prev_alerts=set()), 1000, 5 * scale),
+    }
+
+def bench_receive_metrics(scale, threads=8, per_thread=250, agents=100):
+    """Ingest throughput with `threads` concurrent producers, each with its own event loop."""
+    snap = sample_snapshot()
+    results = {}
+    runs = []
+    for _ in range(3 * scale):
+        fresh_store()
+        barrier = threading.Barrier(threads + 1)
+
+        def worker(t):
+            worker_loop = asyncio.new_event_loop()
+            payloads = [dict(snap, agent_id=f"agent-{(t * per_thread + i) % agents}") for i in range(per_thread)]
+            barrier.wait()
+            for p in payloads:
+                worker_loop.run_until_complete(main.receive_metrics(p))
+            worker_loop.close()
+
+        pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+        for th in pool:
+            th.start()
+        barrier.wait()
+        t0 = time.perf_counter()
+        for th in pool:
+            th.join()
+        runs.append((time.perf_counter() - t0) / (threads * per_thread))
+    results[f"backend.receive_metrics[{threads}x{per_thread}]"] = {
+        "median_s": statistics.median(runs),
+        "min_s": min(runs),
+        "mean_s": statistics.mean(runs),
+        "number": threads * per_thread,
+        "repeat": len(runs),
+    }
+    return results
+
+def bench_get_history(scale):
+    snap = sample_snapshot()
+    results = {}
+    for size in (10, 100, 1000):
+        fresh_store(history=size)
+        fill_store(1, size, snap)
+        results[f"backend.get_history[{size}]"] = measure(
+            lambda: loop.run_until_complete(main.get_history("agent-0", samples=24)), 50, 5 * scale)
+    return results
+
+def bench_get_metrics(scale):
+    snap = sample_snapshot()
+    results = {}
+    for n in (10, 1000, 10000):
+        fresh_store()
+        fill_store(n, 1, snap)
+
+        def serialize():
+            body = loop.run_until_complete(main.get_metrics())
+            return json.dumps(jsonable_encoder(body))
+
+        number = max(1, 2000 // n)
+        results[f"backend.GET /metrics[{n} agents]"] = measure(serialize, number, scale if n >= 10000 else 3 * scale)
+    return results
+
+CASES = {
+    "collect": bench_collect_metrics,
+    "hot_counters": bench_hot_counters,
+    "check_abnormal": bench_check_abnormal,
+    "receive": bench_receive_metrics,
+    "history": bench_get_history,
+    "get_metrics": bench_get_metrics,
+}
+
+# ---------- Baseline comparison ----------
+def compare(results, baseline, threshold):
+    """
+    Return (name, baseline, current, ratio) for cases slower than baseline by
+    more than `threshold`. Compares the fastest round, which is the least noisy.
+    """
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        ratio = res["min_s"] / base["min_s"] if base["min_s"] else float("inf")
+        res["baseline_min_s"] = base["min_s"]
+        res["ratio"] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append((name, base["min_s"], res["min_s"], ratio))
+    return regressions
+
+def fmt_time(s):
+    if s >= 1:
+        return f"{s:.3f} s"
+    if s >= 1e-3:
+        return f"{s * 1e3:.3f} ms"
+    return f"{s * 1e6:.1f} us"
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results.json"), help="Where to write results (JSON)")
+    parser.add_argument("--baseline", help="Results file from a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown vs baseline before failing (0.2 = 20%%)")
+    parser.add_argument("--only", action="append", choices=sorted(CASES), help="Run only these cases (repeatable)")
+    parser.add_argument("--quick", action="store_true", help="Fewer repetitions")
+    args = parser.parse_args()
+
+    install_agent_stubs()
+    scale = 1 if args.quick else 3
+    results = {}
+    for key in args.only or CASES:
+        results.update(CASES[key](scale))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+    for name, res in results.items():
+        line = f"{name:45s} min {fmt_time(res['min_s']):>12s}  median {fmt_time(res['median_s']):>12s}"
+        if "ratio" in res:
+            line += f"   x{res['ratio']:.2f} vs baseline"
+        print(line)
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "meta": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "machine": platform.machine(),
+                "cpu_count": os.cpu_count(),
+                "timestamp": time.time(),
+                "quick": args.quick,
+            },
+            "results": results,
+        }, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:")
+        for name, base, cur, ratio in regressions:
+            print(f"  {name}: {fmt_time(base)} -> {fmt_time(cur)} (x{ratio:.2f})")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main_cli()
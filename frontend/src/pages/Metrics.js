@@ -337,7 +337,18 @@ function Metrics() {
                             borderWidth: 3,
                             pointRadius: 0,
                             pointHoverRadius: 6,
-                          }]
+                          }].concat(hist.cpu_max && hist.cpu_max.length > 0 ? [{
+                            // Peak of the agent's high-frequency samples within each report window
+                            label: 'CPU % (window max)',
+                            data: hist.cpu_max,
+                            borderColor: '#e57373',
+                            borderDash: [6, 4],
+                            fill: false,
+                            tension: 0.4,
+                            borderWidth: 2,
+                            pointRadius: 0,
+                            pointHoverRadius: 6,
+                          }] : [])
                         }}
                         options={{
                           responsive: true,
@@ -404,7 +415,18 @@ function Metrics() {
                             borderWidth: 3,
                             pointRadius: 0,
                             pointHoverRadius: 6,
-                          }]
+                          }].concat(hist.mem_max && hist.mem_max.length > 0 ? [{
+                            // Peak of the agent's high-frequency samples within each report window
+                            label: 'Memory % (window max)',
+                            data: hist.mem_max,
+                            borderColor: '#e57373',
+                            borderDash: [6, 4],
+                            fill: false,
+                            tension: 0.4,
+                            borderWidth: 2,
+                            pointRadius: 0,
+                            pointHoverRadius: 6,
+                          }] : [])
                         }}
                         options={{
                           responsive: true,
@@ -0,0 +1,198 @@
+"""
+Checks the agent's Docker Engine API client against a fake daemon: one
+keep-alive connection across calls, reconnecting after the daemon closes it,
+CPU % from the delta between two stats calls, memory usage on cgroup v1 and
+v2, and DOCKER_HOST parsing.
+
+    python -m pytest tests/test_docker_client.py -q
+"""
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("psutil")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "agent")))
+
+import agent  # noqa: E402
+
+CONTAINER_ID = "c0ffee" * 10 + "abcd"
+# Per stats call: the container uses 0.2s of CPU while the host counts 1s over 2 CPUs -> 40%
+CPU_STEP, SYSTEM_STEP, ONLINE_CPUS = 200_000_000, 1_000_000_000, 2
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        daemon = self.server
+        daemon.requests.append(self.path)
+        if self.path == "/containers/json":
+            body = [{"Id": CONTAINER_ID, "Names": ["/web"], "Image": "nginx:latest",
+                     "State": "running", "Status": "Up 2 minutes"}]
+        elif self.path.startswith(f"/containers/{CONTAINER_ID}/stats"):
+            daemon.stats_calls += 1
+            n = daemon.stats_calls
+            if daemon.cgroup_v1:
+                # cgroup v1 reports total page cache and its inactive part separately
+                mem_stats = {"cache": 100 << 20, "total_inactive_file": 44 << 20, "inactive_file": 4 << 20}
+            else:
+                mem_stats = {"inactive_file": 44 << 20}
+            body = {
+                "cpu_stats": {"cpu_usage": {"total_usage": n * CPU_STEP},
+                              "system_cpu_usage": n * SYSTEM_STEP, "online_cpus": ONLINE_CPUS},
+                "memory_stats": {"usage": 300 << 20, "limit": 1 << 30, "stats": mem_stats},
+                "networks": {"eth0": {"rx_bytes": 1000, "tx_bytes": 2000}},
+                "blkio_stats": {"io_service_bytes_recursive": [{"op": "read", "value": 4096},
+                                                               {"op": "write", "value": 8192}]},
+                "pids_stats": {"current": 3},
+            }
+        elif self.path == "/info":
+            body = {"ContainersRunning": 1}
+        else:
+            self.send_error(404)
+            return
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        if daemon.close_next:
+            # Like a daemon restart or idle timeout: drop the keep-alive connection
+            daemon.close_next = False
+            self.close_connection = True
+
+
+class _FakeDaemonMixin:
+    daemon_threads = True
+
+    def init_state(self):
+        self.connections = 0
+        self.stats_calls = 0
+        self.requests = []
+        self.close_next = False
+        self.cgroup_v1 = False
+
+
+class UnixDaemon(_FakeDaemonMixin, socketserver.ThreadingUnixStreamServer):
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects an (host, port) client address
+        return request, ("local", 0)
+
+
+class TCPDaemon(_FakeDaemonMixin, ThreadingHTTPServer):
+    pass
+
+
+def _serve(server):
+    server.init_state()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def unix_daemon(tmp_path):
+    if not hasattr(socket, "AF_UNIX"):
+        pytest.skip("needs unix sockets")
+    path = str(tmp_path / "docker.sock")
+    server = _serve(UnixDaemon(path, FakeDockerHandler))
+    yield server, path
+    server.shutdown()
+    server.server_close()
+
+
+def test_reuses_one_keepalive_connection(unix_daemon):
+    server, path = unix_daemon
+    client = agent.DockerClient(path)
+    assert client.available()
+    for _ in range(3):
+        assert len(client.container_stats()) == 1
+    assert client.get("/info") == {"ContainersRunning": 1}
+    assert server.connections == 1
+    assert len(server.requests) == 7
+    client.close()
+
+
+def test_reconnects_after_daemon_closes_connection(unix_daemon):
+    server, path = unix_daemon
+    client = agent.DockerClient(path)
+    client.container_stats()
+    server.close_next = True
+    client.get("/info")
+    # The next call finds the connection closed and retries once on a new one
+    stats = client.container_stats()
+    assert len(stats) == 1
+    assert server.connections == 2
+    client.close()
+
+
+def test_cpu_percent_from_delta_between_calls(unix_daemon):
+    _, path = unix_daemon
+    client = agent.DockerClient(path)
+    first = client.container_stats()[0]
+    assert first["cpu_percent"] == 0.0
+    second = client.container_stats()[0]
+    assert second["cpu_percent"] == CPU_STEP / SYSTEM_STEP * ONLINE_CPUS * 100
+    assert second["id"] == CONTAINER_ID[:12]
+    assert second["name"] == "web"
+    assert second["memory_usage"] == 256 << 20
+    assert second["memory_percent"] == 25.0
+    assert (second["net_rx_bytes"], second["net_tx_bytes"]) == (1000, 2000)
+    assert (second["blkio_read_bytes"], second["blkio_write_bytes"]) == (4096, 8192)
+    assert second["pids"] == 3
+    client.close()
+
+
+def test_memory_usage_excludes_inactive_file_on_cgroup_v1(unix_daemon):
+    server, path = unix_daemon
+    server.cgroup_v1 = True
+    client = agent.DockerClient(path)
+    stats = client.container_stats()[0]
+    # Like `docker stats`: usage minus total_inactive_file, not minus all of the page cache
+    assert stats["memory_usage"] == 256 << 20
+    assert stats["memory_percent"] == 25.0
+    client.close()
+
+
+def test_docker_host_parsing(monkeypatch):
+    monkeypatch.delenv("DOCKER_TLS_VERIFY", raising=False)
+    monkeypatch.delenv("DOCKER_HOST", raising=False)
+    assert agent.docker_host() == ("unix", "/var/run/docker.sock")
+    monkeypatch.setenv("DOCKER_HOST", "unix:///run/user/1000/docker.sock")
+    assert agent.docker_host() == ("unix", "/run/user/1000/docker.sock")
+    monkeypatch.setenv("DOCKER_HOST", "tcp://10.0.0.5:2375")
+    assert agent.docker_host() == ("tcp", ("10.0.0.5", 2375))
+    monkeypatch.setenv("DOCKER_HOST", "tcp://docker.internal")
+    assert agent.docker_host() == ("tcp", ("docker.internal", 2375))
+    monkeypatch.setenv("DOCKER_TLS_VERIFY", "1")
+    assert agent.docker_host() == ("tcp", ("docker.internal", 2376))
+
+
+def test_tcp_docker_host(monkeypatch):
+    server = _serve(TCPDaemon(("127.0.0.1", 0), FakeDockerHandler))
+    try:
+        monkeypatch.delenv("DOCKER_TLS_VERIFY", raising=False)
+        monkeypatch.setenv("DOCKER_HOST", f"tcp://127.0.0.1:{server.server_address[1]}")
+        client = agent.DockerClient()
+        assert client.available()
+        assert len(client.container_stats()) == 1
+        assert client.get("/info") == {"ContainersRunning": 1}
+        assert server.connections == 1
+        client.close()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,80 @@
+"""
+Runs two backend shards behind `uvicorn router:app`, adds a third shard at
+runtime and checks that every agent ends up on the shard that owns it with
+its history, and that the router's merged views are complete.
+
+    python -m pytest tests/test_router.py -q
+"""
+import os
+import sys
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from test_shared_store import BACKEND, Backend, _free_port, _post_all, pytestmark  # noqa: E402,F401
+
+sys.path.insert(0, BACKEND)
+from router import HashRing  # noqa: E402
+
+AGENTS, PER_AGENT = 20, 3
+
+
+def _agents_on(shard):
+    return set(requests.get(f"{shard.url}/shard/agents", timeout=5).json())
+
+
+def test_add_shard_moves_agents_to_their_owner(tmp_path):
+    with Backend() as a, Backend() as b, Backend() as c:
+        env = {"SYNCPULSE_SHARDS": f"{a.url},{b.url}", "SYNCPULSE_SHARDS_FILE": str(tmp_path / "shards.json")}
+        with Backend(app="router:app", env=env) as router:
+            assert set(_post_all(router.url, AGENTS, PER_AGENT)) == {200}
+            assert len(_agents_on(a) | _agents_on(b)) == AGENTS
+
+            res = requests.post(f"{router.url}/shards", json={"url": c.url}, timeout=30).json()
+            assert res["ok"] and not res["failed"] and not res["unreachable"]
+            assert res["moved"] == len(_agents_on(c)) > 0
+
+            ring = HashRing([a.url, b.url, c.url])
+            placement = {shard.url: _agents_on(shard) for shard in (a, b, c)}
+            for i in range(AGENTS):
+                agent_id = f"agent-{i}"
+                holders = [url for url, agents in placement.items() if agent_id in agents]
+                assert holders == [ring.get(agent_id)]
+
+            metrics = router.get("/metrics")
+            assert sorted(m["agent_id"] for m in metrics) == sorted(f"agent-{i}" for i in range(AGENTS))
+            health = router.get("/health")
+            assert health["devices_known"] == AGENTS
+            assert health["devices_reporting"] == AGENTS
+            assert set(health["shards"].values()) == {"ok"}
+
+            # Moved agents keep their history
+            for agent_id in placement[c.url]:
+                history = router.get(f"/history/{agent_id}?samples={PER_AGENT}")
+                assert sorted(history["cpu"]) == [float(i) for i in range(PER_AGENT)]
+
+            # Posting a member again rescans and finds nothing left to move
+            res = requests.post(f"{router.url}/shards", json={"url": c.url}, timeout=30).json()
+            assert res["ok"] and res["moved"] == 0
+            assert router.get("/shards")["shards"] == [a.url, b.url, c.url]
+
+
+def test_export_is_complete_or_an_error(tmp_path):
+    with Backend() as a, Backend() as b:
+        env = {"SYNCPULSE_SHARDS": f"{a.url},{b.url}", "SYNCPULSE_SHARDS_FILE": str(tmp_path / "ok.json")}
+        with Backend(app="router:app", env=env) as router:
+            _post_all(router.url, AGENTS, PER_AGENT)
+            res = requests.get(f"{router.url}/export?format=csv", timeout=10)
+            assert res.status_code == 200
+            lines = res.text.splitlines()
+            assert lines[0] == "agent_id,timestamp,cpu.total_percent,memory.percent"
+            assert len(lines) == 1 + AGENTS * PER_AGENT
+
+        # A shard that cannot export fails the whole request instead of dropping its rows
+        dead = f"http://127.0.0.1:{_free_port()}"
+        env = {"SYNCPULSE_SHARDS": f"{a.url},{dead}", "SYNCPULSE_SHARDS_FILE": str(tmp_path / "dead.json")}
+        with Backend(app="router:app", env=env) as router:
+            res = requests.get(f"{router.url}/export?format=ndjson", timeout=10)
+            assert res.status_code == 502
+            assert dead in res.json()["error"]
@@ -0,0 +1,188 @@
+"""
+Runs the backend as `uvicorn main:app --workers N` with SYNCPULSE_STORE=shm and
+checks that every worker serves the same data and that ingest scales with N.
+
+    python -m pytest tests/test_shared_store.py -q
+"""
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+requests = pytest.importorskip("requests")
+pytest.importorskip("uvicorn")
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+pytestmark = pytest.mark.skipif(platform.system() != "Linux", reason="shared-memory store test needs /dev/shm")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Backend:
+    """`uvicorn <app>` from backend/ on a free port, on its own shared-memory segment."""
+
+    def __init__(self, workers=1, app="main:app", env=None, shm_name=None, keep_shm=False):
+        self.workers = workers
+        self.app = app
+        self.extra_env = env or {}
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.shm_name = shm_name or f"syncpulse-test-{os.getpid()}-{self.port}"
+        self.keep_shm = keep_shm
+
+    def __enter__(self):
+        env = dict(os.environ, SYNCPULSE_STORE="shm", SYNCPULSE_SHM_NAME=self.shm_name, SYNCPULSE_SHM_AGENTS="32",
+                   **self.extra_env)
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", self.app, "--port", str(self.port),
+             "--workers", str(self.workers), "--log-level", "warning"],
+            cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                requests.get(f"{self.url}/", timeout=1)
+                # Give the remaining workers time to start accepting
+                time.sleep(0.5 * self.workers)
+                return self
+            except requests.ConnectionError:
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError("backend did not start")
+
+    def __exit__(self, *exc):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        if self.keep_shm:
+            return
+        for path in (f"/dev/shm/{self.shm_name}", os.path.join("/tmp", f"{self.shm_name}.lock")):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def get(self, path):
+        # A new connection per request so that requests land on different workers
+        res = requests.get(f"{self.url}{path}", headers={"Connection": "close"}, timeout=5)
+        res.raise_for_status()
+        return res.json()
+
+
+def _snapshot(agent_id, i):
+    return {
+        "agent_id": agent_id,
+        "timestamp": 1_700_000_000 + i * 5,
+        "cpu": {"total_percent": float(i % 100)},
+        "memory": {"percent": 40.0, "swap_percent": 0},
+        "disks": [{"mountpoint": "/", "percent": 50.0}],
+        "network": [{"bytes_recv": 1, "bytes_sent": 1}],
+        "processes": [{"pid": 100 + p, "name": f"proc-{p}", "cpu": float(p), "memory": 1.0} for p in range(10)],
+    }
+
+
+def _post_all(url, agents, per_agent, threads=16):
+    session = requests.Session()
+    payloads = [_snapshot(f"agent-{a}", i) for i in range(per_agent) for a in range(agents)]
+    with ThreadPoolExecutor(threads) as pool:
+        statuses = list(pool.map(lambda p: session.post(f"{url}/metrics", json=p, timeout=10).status_code, payloads))
+    return statuses
+
+
+def _throughput(workers, agents=16, per_agent=60):
+    with Backend(workers) as backend:
+        _post_all(backend.url, agents, 2)  # warm up every worker
+        t0 = time.perf_counter()
+        statuses = _post_all(backend.url, agents, per_agent)
+        elapsed = time.perf_counter() - t0
+    assert set(statuses) == {200}
+    return len(statuses) / elapsed
+
+
+def test_workers_serve_one_dataset():
+    agents, per_agent = 12, 20
+    with Backend(workers=3) as backend:
+        statuses = _post_all(backend.url, agents, per_agent)
+        assert set(statuses) == {200}
+
+        metrics = [sorted(backend.get("/metrics"), key=lambda m: m["agent_id"]) for _ in range(15)]
+        assert len(metrics[0]) == agents
+        assert all(m == metrics[0] for m in metrics)
+        assert {m["timestamp"] for m in metrics[0]} == {1_700_000_000 + (per_agent - 1) * 5}
+
+        health = [backend.get("/health") for _ in range(15)]
+        assert {h["devices_known"] for h in health} == {agents}
+        assert len({h["total_alerts"] for h in health}) == 1
+        # Each worker tracks the agents that reported to the others too
+        assert {h["devices_reporting"] for h in health} == {agents}
+
+        listed = [sorted((a["agent_id"], a["state"]) for a in backend.get("/agents")["agents"]) for _ in range(15)]
+        assert all(a == listed[0] for a in listed)
+        assert listed[0] == sorted((f"agent-{a}", "up") for a in range(agents))
+
+        history = [backend.get("/history/agent-3?samples=30") for _ in range(15)]
+        assert all(h == history[0] for h in history)
+        # Concurrent posts of one agent may be stored slightly out of order
+        assert sorted(history[0]["cpu"][-per_agent:]) == [float(i) for i in range(per_agent)]
+
+        # Agent timestamps are years old: the time range is by server receive time
+        top = [backend.get("/processes/agent-3/top?minutes=5&limit=3") for _ in range(15)]
+        assert all(t == top[0] for t in top)
+        assert [(p["pid"], p["samples"]) for p in top[0]] == [(109, per_agent), (108, per_agent), (107, per_agent)]
+
+
+def test_workers_track_agents_they_have_not_heard_from():
+    shm_name = f"syncpulse-test-{os.getpid()}-restart"
+    with Backend(workers=1, shm_name=shm_name, keep_shm=True) as backend:
+        assert set(_post_all(backend.url, 4, 2)) == {200}
+    with Backend(workers=2, shm_name=shm_name) as backend:
+        for _ in range(6):
+            assert backend.get("/health")["devices_reporting"] == 4
+            assert sorted(a["agent_id"] for a in backend.get("/agents")["agents"]) == [f"agent-{a}" for a in range(4)]
+        # One report each, so every new agent has reported to a single worker only
+        for a in range(4, 10):
+            requests.post(f"{backend.url}/metrics", json=_snapshot(f"agent-{a}", 0),
+                          headers={"Connection": "close"}, timeout=5).raise_for_status()
+        assert {backend.get("/health")["devices_reporting"] for _ in range(10)} == {10}
+
+
+def test_rejected_snapshots_get_an_error_status():
+    with Backend(workers=2) as backend:
+        big = dict(_snapshot("big", 0), blob="x" * 20000)
+        res = requests.post(f"{backend.url}/metrics", json=big, timeout=5)
+        assert res.status_code == 413
+        assert res.json()["ok"] is False
+
+        # More active alerts than fit in the 2048-byte state slot: nothing is written
+        full = dict(_snapshot("full", 0), disks=[{"mountpoint": f"/snap/core/{i}", "percent": 100, "inode_percent": 100}
+                                                 for i in range(60)])
+        for _ in range(3):
+            res = requests.post(f"{backend.url}/metrics", json=full, timeout=5)
+            assert res.status_code == 413
+        assert backend.get("/health")["total_alerts"] == 0
+
+        statuses = _post_all(backend.url, 33, 1)
+        # SYNCPULSE_SHM_AGENTS=32: the 33rd agent does not fit
+        assert sorted(statuses).count(507) == 1
+
+
+def test_ingest_throughput_scales_with_workers():
+    workers = min(4, os.cpu_count() or 1)
+    if workers < 2:
+        pytest.skip("needs at least 2 CPUs")
+    single = _throughput(1)
+    multi = _throughput(workers)
+    print(f"\ningest: 1 worker {single:.0f} req/s, {workers} workers {multi:.0f} req/s (x{multi / single:.2f})")
+    # Parsing and validation run in parallel; only the copy into shared memory is serialised
+    assert multi > single * 1.3